@@ -27,10 +27,14 @@ class AlertHandler():
         self.rect = self.image.get_rect(center=self.position)
 
     def update(self):
-        current_ticks = pygame.time.get_ticks()
-        if current_ticks - self.start_ticks >= self.duration * 1000:
+        if self.remaining() == 0:
             self.visible = False
 
+    def remaining(self):
+        # milliseconds until the alert hides itself
+        elapsed = pygame.time.get_ticks() - self.start_ticks
+        return max(0, self.duration * 1000 - elapsed)
+
     def draw(self, surface):
         if self.visible:
             pygame.draw.rect(surface, self.background_color,
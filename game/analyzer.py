@@ -0,0 +1,181 @@
+import queue
+import threading
+import numpy as np
+from .settings import *
+
+
+# logic analyzer. the probed nets are sampled every tick into a preallocated
+# ring of ANALYZER_DEPTH ticks, one uint8 column per probe, so a capture
+# never grows however long it runs. the waveform panel draws from the ring
+# and an export hands copies of whole blocks to a VcdWriter thread through
+# a bounded queue, the simulation never waits on the disk
+
+class LogicAnalyzer:
+    def __init__(self, depth=ANALYZER_DEPTH, max_probes=ANALYZER_MAX_PROBES, block=ANALYZER_BLOCK):
+        self.samples = np.zeros((depth, max_probes), dtype=np.uint8)
+        self.depth = depth
+        self.max_probes = max_probes
+        self.block = min(block, depth // 2)
+        self.labels = []
+        self.nets = np.zeros(0, dtype=np.intp)
+        # uint8 view of the netlist's net values
+        self.values = None
+        # columns sampled, 0 until there are probes and values to read
+        self.count = 0
+        # ticks sampled so far, tick t is row t % depth. the capture starts at start
+        self.tick = 0
+        self.start = 0
+        self.writer = None
+        # first tick not handed to the writer yet
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    def probe(self, labels, nets):
+        # a new set of probes starts a new capture and ends an export
+        if len(labels) > self.max_probes:
+            raise ValueError(f'at most {self.max_probes} probes')
+        self.stop_export()
+        self.labels = list(labels)
+        self.nets = np.fromiter(nets, dtype=np.intp)
+        self.start = self.tick
+        self.count = len(self.nets) if self.values is not None else 0
+
+    def attach(self, values, nets=None):
+        # after the netlist is rebuilt, with the new numbers of the probed nets
+        self.values = np.frombuffer(values, dtype=np.uint8)
+        if nets is not None:
+            self.nets = np.fromiter(nets, dtype=np.intp)
+        self.count = len(self.nets)
+
+    def sample(self, repeat=1):
+        # the probed values for the next repeat ticks
+        count = self.count
+        if not count:
+            return
+        if repeat == 1:
+            # every tick while the circuit is busy, kept as cheap as possible
+            self.samples[self.tick % self.depth, :count] = self.values[self.nets]
+            self.tick += 1
+            if self.writer and self.tick - self.flushed >= self.block:
+                self.flush()
+            return
+        row = self.values[self.nets]
+        while repeat > 0:
+            ticks = min(repeat, self.block)
+            self.samples[np.arange(self.tick, self.tick + ticks) % self.depth, :count] = row
+            self.tick += ticks
+            repeat -= ticks
+            if self.writer and self.tick - self.flushed >= self.block:
+                self.flush()
+
+    def window(self, ticks):
+        # the last ticks of the capture, oldest first
+        start = max(self.tick - ticks, self.tick - self.depth, self.start)
+        return self.samples[np.arange(start, self.tick) % self.depth, :len(self.labels)]
+
+    @property
+    def exporting(self):
+        return self.writer is not None
+
+    def export(self, path):
+        # streams every tick from now on to a vcd file
+        self.stop_export()
+        self.writer = VcdWriter(path, self.labels, self.tick)
+        self.flushed = self.tick
+
+    def flush(self):
+        if self.tick > self.flushed:
+            rows = np.arange(self.flushed, self.tick) % self.depth
+            self.writer.put(self.flushed, self.samples[rows, :len(self.labels)])
+        self.flushed = self.tick
+
+    def stop_export(self):
+        # returns the number of ticks the writer could not keep up with
+        if not self.writer:
+            return 0
+        self.flush()
+        self.writer.close(self.tick)
+        dropped = self.writer.dropped
+        self.writer = None
+        return dropped
+
+
+class VcdWriter:
+    # writes blocks of samples as value changes on its own thread. a block
+    # that does not fit in the queue is dropped and noted in the file
+    # instead of holding up the simulation
+    def __init__(self, path, labels, origin=0, timescale=VCD_TIMESCALE):
+        self.file = open(path, 'w')
+        self.ids = [vcd_identifier(k) for k in range(len(labels))]
+        # the value change line of every probe going low or high
+        self.changes = np.array([[f'0{identifier}\n', f'1{identifier}\n'] for identifier in self.ids],
+                                dtype=object).reshape(len(self.ids), 2)
+        self.origin = origin
+        self.expected = origin
+        self.last = None
+        self.dropped = 0
+        self.file.write(f'$timescale {timescale} $end\n$scope module board $end\n')
+        for identifier, label in zip(self.ids, labels):
+            self.file.write(f'$var wire 1 {identifier} {label} $end\n')
+        self.file.write('$upscope $end\n$enddefinitions $end\n')
+        self.queue = queue.Queue(maxsize=VCD_QUEUE_BLOCKS)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, start, rows):
+        try:
+            self.queue.put_nowait((start, rows))
+        except queue.Full:
+            self.dropped += len(rows)
+
+    def close(self, end):
+        self.queue.put((end, None))
+        self.thread.join()
+
+    def run(self):
+        try:
+            while True:
+                start, rows = self.queue.get()
+                if rows is None:
+                    self.file.write(f'#{start - self.origin}\n')
+                    return
+                self.write_block(start, rows)
+        finally:
+            self.file.close()
+
+    def write_block(self, start, rows):
+        lines = []
+        if start != self.expected:
+            lines.append(f'$comment {start - self.expected} ticks dropped $end\n')
+            self.last = None
+        self.expected = start + len(rows)
+
+        # the first row of an export or after a gap is written in full
+        previous = np.logical_not(rows[:1]) if self.last is None else self.last[None]
+        changes = np.concatenate((previous, rows[:-1])) != rows
+        self.last = rows[-1]
+
+        # one time line before the changes of every tick, put together with
+        # array operations so the thread holds the interpreter lock briefly
+        ticks, columns = np.nonzero(changes)
+        firsts = np.flatnonzero(np.diff(ticks, prepend=-1))
+        out = np.empty(len(ticks) + len(firsts), dtype=object)
+        times = firsts + np.arange(len(firsts))
+        out[times] = [f'#{tick}\n' for tick in (ticks[firsts] + start - self.origin).tolist()]
+        is_change = np.ones(len(out), dtype=bool)
+        is_change[times] = False
+        out[is_change] = self.changes[columns, rows[ticks, columns]]
+        lines += out.tolist()
+        self.file.write(''.join(lines))
+
+
+def vcd_identifier(k):
+    # short names from the printable ascii characters
+    identifier = ''
+    while True:
+        k, digit = divmod(k, 94)
+        identifier += chr(33 + digit)
+        if not k:
+            return identifier
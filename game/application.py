@@ -1,3 +1,4 @@
+import os
 import pygame
 import sys
 from .settings import *
@@ -5,21 +6,44 @@ from .loop import Loop
 
 
 class Game:
-    def __init__(self) -> None:
+    def __init__(self, circuit_path=None, profile_path=None) -> None:
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         self.clock = pygame.time.Clock()
-        self.loop = Loop()
+        self.loop = Loop(circuit_path or CIRCUIT_FILE, profile_path)
+        if circuit_path and os.path.exists(circuit_path):
+            try:
+                self.loop.load_circuit(circuit_path)
+            except (OSError, ValueError) as error:
+                self.loop.show_alert(str(error), 'error')
         pygame.display.set_caption('Digital Logic Simulator')
 
     def run(self):
         while True:
-            events = pygame.event.get()
+            timeout = self.loop.idle_timeout()
+            if timeout is not None:
+                # nothing is moving, sleep until input arrives or an alert expires
+                event = pygame.event.wait(timeout)
+                events = [] if event.type == pygame.NOEVENT else [event]
+                events += pygame.event.get()
+            else:
+                events = pygame.event.get()
             for event in events:
                 if event.type == pygame.QUIT:
+                    self.loop.profiler.close()
+                    self.loop.analyzer.stop_export()
                     pygame.quit()
                     sys.exit()
 
-            dt = self.clock.tick() / 1000
-            self.loop.run(dt, events)  # Pass events to Loop
-            pygame.display.update()
+            # capped at MAX_FPS, the loop turns dt into simulation ticks.
+            # time spent asleep is not owed to the simulation, but the frame
+            # after it runs one tick for the input that ended it
+            dt = self.clock.tick(MAX_FPS) / 1000
+            if timeout is not None:
+                dt = 0
+                self.loop.scheduler.wake()
+            dirty_rects = self.loop.run(dt, events)  # Pass events to Loop
+            with self.loop.profiler.phase('display'):
+                if dirty_rects:
+                    pygame.display.update(dirty_rects)
+            self.loop.profiler.end_frame()
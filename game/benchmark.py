@@ -0,0 +1,277 @@
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+import pygame
+from .settings import *
+from .draggableObject import *
+from .loop import Loop, make_component, connect
+from .netlist import Netlist
+from .levelized import LevelizedNetlist
+from .compiled import CompiledNetlist
+
+
+# reproducible benchmarks on synthetic circuits built from the real component
+# classes. every generator returns (objects, cables) ready for Loop.set_board,
+# run_benchmarks writes one json report that can be diffed run to run
+
+COLUMN_WIDTH = 60
+ROW_HEIGHT = 110
+
+
+def place(obj, column, row):
+    obj.rect.topleft = (10 + column * COLUMN_WIDTH, 60 + row * ROW_HEIGHT)
+    return obj
+
+
+def ripple_carry_adder(bits):
+    # two switches per bit plus a carry in, a light per sum bit and the carry out
+    objects = []
+    cables = []
+
+    def add(name, column, row):
+        obj = place(make_component(name), column, row)
+        objects.append(obj)
+        return obj
+
+    carry = add('SWITCH', 0, 0)
+    for bit in range(bits):
+        column = 1 + bit * 5
+        a = add('SWITCH', column, 0)
+        b = add('SWITCH', column + 1, 0)
+        half = add('XOR', column, 1)
+        total = add('XOR', column + 1, 2)
+        both = add('AND', column + 2, 1)
+        carried = add('AND', column + 3, 2)
+        carry_out = add('OR', column + 3, 3)
+        cables += [connect(a, 0, half, 0), connect(b, 0, half, 1),
+                   connect(a, 0, both, 0), connect(b, 0, both, 1),
+                   connect(half, 0, total, 0), connect(carry, 0, total, 1),
+                   connect(half, 0, carried, 0), connect(carry, 0, carried, 1),
+                   connect(both, 0, carry_out, 0), connect(carried, 0, carry_out, 1)]
+        cables.append(connect(total, 0, add('LIGHT', column + 1, 4), 0))
+        carry = carry_out
+    cables.append(connect(carry, 0, add('LIGHT', bits * 5 + 1, 4), 0))
+    return objects, cables
+
+
+def not_chain(length):
+    # one switch through a long line of inverters into a light
+    objects = [place(make_component('SWITCH'), 0, 0)]
+    cables = []
+    for k in range(length):
+        gate = place(make_component('NOT'), (k + 1) % 200, 1 + (k + 1) // 200)
+        cables.append(connect(objects[-1], 0, gate, 0))
+        objects.append(gate)
+    light = place(make_component('LIGHT'), 0, 2 + length // 200)
+    cables.append(connect(objects[-1], 0, light, 0))
+    objects.append(light)
+    return objects, cables
+
+
+def random_dag(gates, inputs=32, seed=1):
+    # gates reading random earlier outputs, the last gates drive lights
+    rng = random.Random(seed)
+    names = ('AND', 'OR', 'NOT', 'NAND', 'NOR', 'XOR')
+    sources = [place(make_component('SWITCH'), k, 0) for k in range(inputs)]
+    objects = list(sources)
+    cables = []
+    for k in range(gates):
+        gate = place(make_component(rng.choice(names)), k % 200, 1 + k // 200)
+        for input_index in range(gate.input_count):
+            cables.append(connect(rng.choice(sources[-200:] if rng.random() < 0.8 else sources),
+                                  0, gate, input_index))
+        sources.append(gate)
+        objects.append(gate)
+    for k, source in enumerate(sources[-inputs:]):
+        light = place(make_component('LIGHT'), k, 2 + gates // 200)
+        cables.append(connect(source, 0, light, 0))
+        objects.append(light)
+    return objects, cables
+
+
+def cable_mesh(rows, width=40, seed=1):
+    # rows of gates each wired to random gates of the row before, lots of
+    # long crossing cables on a small area
+    rng = random.Random(seed)
+    previous = [place(make_component('SWITCH'), k, 0) for k in range(width)]
+    objects = list(previous)
+    cables = []
+    for row in range(1, rows + 1):
+        current = []
+        for k in range(width):
+            gate = place(make_component('XOR'), k, row)
+            cables.append(connect(rng.choice(previous), 0, gate, 0))
+            cables.append(connect(rng.choice(previous), 0, gate, 1))
+            current.append(gate)
+        objects += current
+        previous = current
+    return objects, cables
+
+
+def latch_array(count):
+    # nor latches, each with a set and a reset switch. the set switches start
+    # on so the latches come up in a stable state
+    objects = []
+    cables = []
+    for k in range(count):
+        column = (k % 50) * 2
+        row = (k // 50) * 3
+        set_switch = place(make_component('SWITCH'), column, row)
+        reset_switch = place(make_component('SWITCH'), column + 1, row)
+        set_switch.toggle_switch()
+        q = place(make_component('NOR'), column, row + 1)
+        q_bar = place(make_component('NOR'), column + 1, row + 1)
+        light = place(make_component('LIGHT'), column, row + 2)
+        cables += [connect(reset_switch, 0, q, 0), connect(q_bar, 0, q, 1),
+                   connect(set_switch, 0, q_bar, 0), connect(q, 0, q_bar, 1),
+                   connect(q, 0, light, 0)]
+        objects += [set_switch, reset_switch, q, q_bar, light]
+    return objects, cables
+
+
+def settle(netlist, max_ticks=1000):
+    # ticks until nothing changes, capped for loops that never settle
+    ticks = 0
+    while not netlist.settled() and ticks < max_ticks:
+        netlist.step()
+        ticks += 1
+    return ticks
+
+
+def timed(fn, repeat):
+    # mean seconds per call
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def measure(loop, objects, cables, rng):
+    result = {'components': len(objects), 'cables': len(cables)}
+
+    start = time.perf_counter()
+    loop.set_board(objects, cables)
+    loop.simulate(0)
+    result['build_ms'] = (time.perf_counter() - start) * 1000
+
+    switches = [obj for obj in objects if isinstance(obj, Switch)]
+    modes = (('event', Netlist), ('levelized', LevelizedNetlist),
+             ('optimized', lambda: LevelizedNetlist(optimize=True)), ('compiled', CompiledNetlist))
+    for mode, create in modes:
+        netlist = create()
+        start = time.perf_counter()
+        netlist.build(objects, cables)
+        compile_ms = (time.perf_counter() - start) * 1000
+        settle(netlist)
+
+        # settle latency after flipping the first switch
+        net = netlist.output_start[netlist.index[switches[0]]]
+        start = time.perf_counter()
+        netlist.set_output(switches[0], not netlist.values[net])
+        settle_ticks = settle(netlist)
+        settle_ms = (time.perf_counter() - start) * 1000
+
+        # ticks per second with a switch flipped before every tick
+        ticks = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 0.5:
+            switch = rng.choice(switches)
+            netlist.set_output(switch, rng.random() < 0.5)
+            netlist.step()
+            ticks += 1
+        result[mode] = {
+            'gates': len(netlist.program),
+            'compile_ms': compile_ms,
+            'settle_ms': settle_ms,
+            'settle_ticks': settle_ticks,
+            'ticks_per_s': ticks / (time.perf_counter() - start),
+        }
+
+    # frame time, incremental and with the whole screen redrawn
+    loop.run(1 / 60, [])
+    result['frame_ms'] = timed(lambda: loop.run(1 / 60, []), 20) * 1000
+
+    def full_frame():
+        loop.renderer.invalidate()
+        loop.run(1 / 60, [])
+    result['full_frame_ms'] = timed(full_frame, 10) * 1000
+
+    def pan_frame():
+        loop.camera.pan(10, 0)
+        loop.run(1 / 60, [])
+    result['pan_frame_ms'] = timed(pan_frame, 20) * 1000
+    loop.camera.reset()
+    loop.run(1 / 60, [])
+
+    # hit-testing at random points of the board
+    bounds = objects[0].rect.unionall([obj.rect for obj in objects])
+    points = [(rng.randint(bounds.left, bounds.right), rng.randint(bounds.top, bounds.bottom))
+              for _ in range(200)]
+    result['snap_us'] = timed(
+        lambda: loop.find_closest_input_snap_point(rng.choice(points)), 1000) * 1e6
+    clicks = [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=point) for point in points]
+
+    def click():
+        loop.cable_click(rng.choice(clicks))
+        for cable in loop.selected_cables:
+            cable.selected = False
+        loop.selected_cables.clear()
+    result['cable_click_us'] = timed(click, 1000) * 1e6
+    return result
+
+
+def measure_memory(generate):
+    # memory held by a board and its loop, traced apart from the timings
+    tracemalloc.start()
+    loop = Loop()
+    loop.set_board(*generate())
+    loop.simulate(0)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'memory_kb': current / 1024, 'peak_memory_kb': peak / 1024}
+
+
+def run_benchmarks(report_path, scale=1.0, seed=1):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((WIDTH, HEIGHT))
+
+    size = lambda n: max(1, int(n * scale))
+    circuits = {
+        f'adder_{size(64)}': lambda: ripple_carry_adder(size(64)),
+        f'not_chain_{size(2000)}': lambda: not_chain(size(2000)),
+        f'random_dag_{size(5000)}': lambda: random_dag(size(5000), seed=seed),
+        f'cable_mesh_{size(50)}': lambda: cable_mesh(size(50), seed=seed),
+        f'latch_array_{size(500)}': lambda: latch_array(size(500)),
+    }
+
+    report = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'scale': scale,
+        'seed': seed,
+        'circuits': {},
+    }
+    for name, generate in circuits.items():
+        start = time.perf_counter()
+        objects, cables = generate()
+        generate_ms = (time.perf_counter() - start) * 1000
+        result = measure(Loop(), objects, cables, random.Random(seed))
+        result['generate_ms'] = generate_ms
+        del objects, cables
+        result.update(measure_memory(generate))
+        report['circuits'][name] = result
+        print(f"{name}: {result['compiled']['ticks_per_s']:.0f} ticks/s compiled, "
+              f"{result['optimized']['ticks_per_s']:.0f} ticks/s optimized, "
+              f"{result['levelized']['ticks_per_s']:.0f} ticks/s levelized, "
+              f"{result['event']['ticks_per_s']:.0f} ticks/s event, "
+              f"{result['frame_ms']:.2f} ms/frame")
+
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    pygame.quit()
+    return report
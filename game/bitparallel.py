@@ -0,0 +1,108 @@
+import numpy as np
+from .netlist import *
+from .levelized import schedule, group_by_op, group_chips, chip_patterns, MAX_FEEDBACK_ITERATIONS
+
+
+# gate functions on packed words, every bit is a separate stimulus pattern
+PACKED_OPS = {
+    OP_AND: lambda a, b: a & b,
+    OP_OR: lambda a, b: a | b,
+    OP_NOT: lambda a, b: ~a,
+    OP_NAND: lambda a, b: ~(a & b),
+    OP_NOR: lambda a, b: ~(a | b),
+    OP_XOR: lambda a, b: a ^ b,
+}
+
+PATTERNS_PER_WORD = 64
+MAX_TRUTH_TABLE_INPUTS = 24
+
+
+def pack_bits(bits):
+    # array of 0/1 per pattern -> uint64 words, pattern k is bit k % 64 of word k // 64
+    words = -(-len(bits) // PATTERNS_PER_WORD)
+    padded = np.zeros(words * PATTERNS_PER_WORD, dtype=np.uint8)
+    padded[:len(bits)] = bits
+    return np.packbits(padded, bitorder='little').view('<u8').astype(np.uint64)
+
+
+def unpack_bits(words, count):
+    return np.unpackbits(words.astype('<u8').view(np.uint8), bitorder='little')[:count]
+
+
+def packed_chip_outputs(chip, words):
+    # packed input words (instances, pins, words) -> packed output words
+    bits = np.unpackbits(np.ascontiguousarray(words, dtype='<u8').view(np.uint8),
+                         axis=-1, bitorder='little')
+    result = np.packbits(chip_patterns(chip, bits), axis=-1, bitorder='little')
+    return np.ascontiguousarray(result).view('<u8').astype(np.uint64)
+
+
+def simulate_patterns(netlist, stimulus, words):
+    # stimulus maps switch component ids to packed words, other switches keep
+    # their current value for every pattern
+    values = np.zeros((len(netlist.values), words), dtype=np.uint64)
+    for component, op in enumerate(netlist.ops):
+        if op == OP_SWITCH:
+            net = netlist.output_start[component]
+            if component in stimulus:
+                values[net] = stimulus[component]
+            elif netlist.values[net]:
+                values[net] = ~np.uint64(0)
+    # nets an optimized netlist folded to a constant
+    for net, value in netlist.constants.items():
+        if value:
+            values[net] = ~np.uint64(0)
+
+    for gates, rounds in schedule(netlist):
+        cyclic = bool(rounds)
+        rounds = [(group_by_op(netlist, members), group_chips(netlist, members))
+                  for members in (rounds or [gates])]
+        # feedback loops are swept until every pattern stops changing
+        for _ in range(MAX_FEEDBACK_ITERATIONS if cyclic else 1):
+            moved = False
+            for groups, chips in rounds:
+                results = [(out, PACKED_OPS[op](values[a], values[b]))
+                           for op, out, a, b in groups]
+                results += [(out, packed_chip_outputs(chip, values[inputs]))
+                            for chip, out, inputs in chips]
+                for out, result in results:
+                    if not np.array_equal(values[out], result):
+                        values[out] = result
+                        moved = True
+            if not moved:
+                break
+    for net, source in netlist.aliases.items():
+        values[net] = values[source]
+    return values
+
+
+def truth_table(netlist, switches=None, max_inputs=MAX_TRUTH_TABLE_INPUTS):
+    # every combination of the switches, 64 patterns per machine word
+    if switches is None:
+        switches = [c for c, op in enumerate(netlist.ops) if op == OP_SWITCH]
+    if len(switches) > max_inputs:
+        raise ValueError(f'truth table over {len(switches)} switches is too large')
+
+    count = 1 << len(switches)
+    patterns = np.arange(count, dtype=np.uint64)
+    stimulus = {switch: pack_bits((patterns >> np.uint64(j)) & np.uint64(1))
+                for j, switch in enumerate(switches)}
+    words = -(-count // PATTERNS_PER_WORD)
+    values = simulate_patterns(netlist, stimulus, words)
+
+    columns = [f'{OPCODE_NAMES[netlist.ops[s]]} {s}' for s in switches]
+    rows = [unpack_bits(stimulus[s], count) for s in switches]
+    for sink in netlist.sinks:
+        start = netlist.input_start[sink]
+        end = netlist.input_start[sink + 1]
+        for k, net in enumerate(netlist.input_nets[start:end]):
+            columns.append(f'{OPCODE_NAMES[netlist.ops[sink]]} {sink}.{k}')
+            rows.append(unpack_bits(values[net], count))
+    return columns, np.array(rows, dtype=np.uint8).T.reshape(count, len(columns))
+
+
+def format_truth_table(columns, table):
+    lines = [' | '.join(columns)]
+    for row in table:
+        lines.append(' | '.join(str(bit).rjust(len(name)) for bit, name in zip(row, columns)))
+    return '\n'.join(lines)
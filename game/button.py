@@ -1,5 +1,6 @@
 import pygame
 from .settings import *
+from .image_cache import scaled_image
 
 
 class Button(pygame.sprite.Sprite):
@@ -23,10 +24,9 @@ class Button(pygame.sprite.Sprite):
         self.image.blit(text_surf, text_rect)
 
     def add_image(self, image_path):
-        loaded_image = pygame.image.load(image_path)
         # Resize the image to fit the button if necessary
-        loaded_image = pygame.transform.scale(
-            loaded_image, (self.rect.width - 20, self.rect.height - 10))
+        loaded_image = scaled_image(
+            image_path, (self.rect.width - 20, self.rect.height - 10))
         # center img
         img_rect = loaded_image.get_rect()
         img_rect.center = (self.rect.width // 2, self.rect.height // 2)
@@ -1,12 +1,19 @@
 import pygame
 from .settings import *
 import numpy as np
+import math
+from .renderer import line_rect, merge_rects, exposed_strips
 
 
-# then update state of cable, get state from input give state to output
+# a wire from an output port to an input port. the netlist sets whether it
+# is active and the CableLayer draws it
 
 class Cable:
-    def __init__(self, start_pos, end_pos, output_obj=None, input_obj=None, input_index=None):
+    __slots__ = ('start_pos', 'end_pos', 'active', 'selected',
+                 'output_obj', 'output_index', 'input_obj', 'input_index')
+
+    def __init__(self, start_pos, end_pos, output_obj=None, input_obj=None, input_index=None,
+                 output_index=0):
         self.start_pos = start_pos
         self.end_pos = end_pos
         self.active = False
@@ -14,32 +21,22 @@ class Cable:
         # start = output_obj
         # end = input_obj
         self.output_obj = output_obj
+        self.output_index = output_index  # Chips can have several outputs
         self.input_obj = input_obj
         self.input_index = input_index  # Store which input it's connected to
 
-    def update_state(self):
-        x, y, state = self.output_obj.output[0]
-        self.active = state
-        self.input_obj.inputs[self.input_index][2] = state
-
-    def draw(self, surface):
+    def color(self):
         if self.selected:
-            pygame.draw.line(surface, WIRE_COLOR_SELECTED,
-                             self.start_pos, self.end_pos, 3)
-        else:
-            if self.active:
-                pygame.draw.line(surface, WIRE_COLOR_ACTIVE,
-                                 self.start_pos, self.end_pos, 3)
-            else:
-                pygame.draw.line(surface, WIRE_COLOR,
-                                 self.start_pos, self.end_pos, 3)
+            return WIRE_COLOR_SELECTED
+        return WIRE_COLOR_ACTIVE if self.active else WIRE_COLOR
 
     def update(self):
-        # Update the start position based on the output_obj's position
+        # Update the start position based on the output_obj's position and output_index
         if self.output_obj:
+            output_slot = self.output_obj.output[self.output_index]
             self.start_pos = (
-                self.output_obj.rect.x + self.output_obj.output[0][0],
-                self.output_obj.rect.y + self.output_obj.output[0][1]
+                self.output_obj.rect.x + output_slot[0],
+                self.output_obj.rect.y + output_slot[1]
             )
 
         # Update the end position based on the input_obj's position and input_index
@@ -50,13 +47,6 @@ class Cable:
                 self.input_obj.rect.y + input_slot[1]
             )
 
-    def is_left_clicked(self, event, threshold=5):
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            distance = point_line_distance(
-                event.pos, self.start_pos, self.end_pos)
-            return distance <= threshold
-        return False
-
     def intersects_rect(self, rect):
         # check if either end of the cable is within (selection box)
         start_inside = rect.collidepoint(self.start_pos)
@@ -65,30 +55,231 @@ class Cable:
         return start_inside or end_inside
 
 
-def point_line_distance(point, line_start, line_end):
-    # Convert points to numpy arrays for vector operations
-    point = np.array(point)
-    line_start = np.array(line_start)
-    line_end = np.array(line_end)
+def draw_line(surface, color, start_pos, end_pos, width):
+    # a thick line as a filled quad, unlike pygame.draw.line it rasterizes the
+    # same with or without a clip rect, so partial repaints leave no seams
+    dx = end_pos[0] - start_pos[0]
+    dy = end_pos[1] - start_pos[1]
+    length = math.hypot(dx, dy) or 1
+    nx = -dy / length * width / 2
+    ny = dx / length * width / 2
+    pygame.draw.polygon(surface, color, [
+        (start_pos[0] + nx, start_pos[1] + ny),
+        (end_pos[0] + nx, end_pos[1] + ny),
+        (end_pos[0] - nx, end_pos[1] - ny),
+        (start_pos[0] - nx, start_pos[1] - ny),
+    ])
+
+
+def segments_in_rect(segments, rect):
+    # liang-barsky clipping of every (x0, y0, x1, y1) row against the rect,
+    # true where some part of the segment is left inside. a pixel of slack
+    # on every side covers how pygame rounds lines onto pixels
+    x0, y0 = segments[:, 0], segments[:, 1]
+    dx, dy = segments[:, 2] - x0, segments[:, 3] - y0
+    left, top = rect[0] - 1, rect[1] - 1
+    right, bottom = rect[0] + rect[2], rect[1] + rect[3]
+    enter = np.zeros(len(segments))
+    leave = np.ones(len(segments))
+    inside = np.ones(len(segments), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in ((-dx, x0 - left), (dx, right - x0), (-dy, y0 - top), (dy, bottom - y0)):
+            # parallel to this border, inside only on the right side of it
+            inside &= (p != 0) | (q >= 0)
+            t = q / p
+            np.maximum(enter, t, out=enter, where=p < 0)
+            np.minimum(leave, t, out=leave, where=p > 0)
+    return inside & (enter <= leave)
+
+
+def point_segment_distances(point, segments):
+    # distance from one point to every (x0, y0, x1, y1) row in a single pass
+    start = segments[:, :2]
+    line_vec = segments[:, 2:] - start
+    point_vec = np.asarray(point, dtype=float) - start
+
+    # Project onto each line, zero length cables just measure to their start
+    line_len_sq = np.einsum('ij,ij->i', line_vec, line_vec)
+    proj = np.einsum('ij,ij->i', point_vec, line_vec)
+    t = np.divide(proj, line_len_sq, out=np.zeros_like(proj), where=line_len_sq > 0)
+    np.clip(t, 0, 1, out=t)
+
+    closest_vec = point_vec - line_vec * t[:, None]
+    return np.hypot(closest_vec[:, 0], closest_vec[:, 1])
+
+
+class CableSegments:
+    # endpoints of all cables in one contiguous (N, 4) array for batched hit-testing
+    def __init__(self, capacity=64):
+        self.segments = np.zeros((capacity, 4), dtype=float)
+        self.cables = []
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.cables)
+
+    def add(self, cable):
+        if len(self.cables) == len(self.segments):
+            grown = np.zeros((len(self.segments) * 2, 4), dtype=float)
+            grown[:len(self.segments)] = self.segments
+            self.segments = grown
+        self.rows[cable] = len(self.cables)
+        self.cables.append(cable)
+        self.update(cable)
 
-    line_vec = line_end - line_start
-    point_vec = point - line_start
+    def update(self, cable):
+        row = self.rows.get(cable)
+        if row is not None:
+            self.segments[row] = (*cable.start_pos, *cable.end_pos)
 
-    # Calculate the projection of point_vec onto line_vec
-    line_len = np.linalg.norm(line_vec)
-    line_unitvec = line_vec / line_len
-    proj_length = np.dot(point_vec, line_unitvec)
+    def remove(self, cable):
+        # move the last row into the hole to keep the array contiguous
+        row = self.rows.pop(cable, None)
+        if row is None:
+            return
+        last = self.cables.pop()
+        if last is not cable:
+            self.cables[row] = last
+            self.rows[last] = row
+            self.segments[row] = self.segments[len(self.cables)]
 
-    if proj_length < 0:
-        # Closest point is the line start
-        closest_point = line_start
-    elif proj_length > line_len:
-        # Closest point is the line end
-        closest_point = line_end
-    else:
-        # Closest point is somewhere in the middle
-        closest_point = line_start + line_unitvec * proj_length
+    def nearest(self, point, threshold=5):
+        if not self.cables:
+            return None
+        distances = point_segment_distances(point, self.segments[:len(self.cables)])
+        row = int(np.argmin(distances))
+        if distances[row] <= threshold:
+            return self.cables[row]
+        return None
 
-    distance = np.linalg.norm(point - closest_point)
+    def in_rect(self, rect):
+        # cables whose segment touches the rect, clipped all at once
+        if not self.cables:
+            return []
+        hits = segments_in_rect(self.segments[:len(self.cables)], rect)
+        cables = self.cables
+        return [cables[row] for row in np.flatnonzero(hits).tolist()]
 
-    return distance
+
+def wire_width(zoom):
+    return 1 if zoom < LOD_IMAGE_ZOOM else max(1, round(3 * zoom))
+
+
+class CableLayer:
+    # every connected cable pre-rendered onto one screen sized surface. cables
+    # that may have moved or changed color are touched, refresh redraws only
+    # the areas they cover, selected ones on top, so unchanged wiring costs one
+    # blit per frame. cables off screen are never drawn, a pan scrolls the
+    # layer and only draws the strips it uncovers
+    def __init__(self, board_index, camera, size=(WIDTH, HEIGHT)):
+        self.board_index = board_index
+        self.camera = camera
+        self.surface = pygame.Surface(size)
+        self.surface.set_colorkey(CABLE_LAYER_COLORKEY)
+        self.surface.fill(CABLE_LAYER_COLORKEY)
+        self.rect = self.surface.get_rect()
+        # cable -> (rect, color) as it is on the layer, rects are in
+        # camera.scale coordinates so a pan does not change them
+        self.drawn = {}
+        self.pending = set()
+        # screen areas to repaint
+        self.dirty = []
+        # cables are cut to these bounds, in camera.scale coordinates. they
+        # only change when the layer is redrawn in full, so every part of a
+        # cable is drawn from the same polygon however the layer was scrolled
+        self.bounds = None
+        # cables drawn by the last refresh, for the profiler
+        self.painted = 0
+        self.invalidate()
+
+    def invalidate(self):
+        # the zoom changed, everything in view is drawn again
+        self.drawn = {}
+        self.dirty = [self.rect]
+        # a screen of slack on every side before the view runs out of bounds
+        self.bounds = self.rect.move(self.camera.x, self.camera.y).inflate(
+            self.rect.width * 2, self.rect.height * 2)
+
+    def scroll(self, dx, dy):
+        view = self.rect.move(self.camera.x, self.camera.y)
+        if not self.bounds.contains(view.inflate(12, 12)):
+            self.invalidate()
+            return
+        self.surface.set_clip(None)
+        self.surface.scroll(dx, dy)
+        self.dirty = [rect.move(dx, dy) for rect in self.dirty]
+        self.dirty += exposed_strips(self.rect, dx, dy)
+
+    def touch(self, cables):
+        self.pending.update(cables)
+
+    def add(self, cable):
+        self.pending.add(cable)
+
+    def remove(self, cable):
+        self.pending.discard(cable)
+        drawn = self.drawn.pop(cable, None)
+        if drawn is not None:
+            self.dirty.append(drawn[0].move(-self.camera.x, -self.camera.y))
+
+    def refresh(self):
+        # brings touched cables up to date, returns the screen areas that changed
+        board_index = self.board_index
+        camera = self.camera
+        scale = camera.scale
+        width = wire_width(camera.zoom)
+        for cable in self.pending:
+            start_pos, end_pos = cable.start_pos, cable.end_pos
+            cable.update()
+            if cable.start_pos != start_pos or cable.end_pos != end_pos:
+                board_index.update_cable(cable)
+            drawn = (line_rect(scale(cable.start_pos), scale(cable.end_pos), width), cable.color())
+            previous = self.drawn.get(cable)
+            if previous != drawn:
+                if previous is not None:
+                    self.dirty.append(previous[0].move(-camera.x, -camera.y))
+                self.dirty.append(drawn[0].move(-camera.x, -camera.y))
+                self.drawn[cable] = drawn
+        self.pending.clear()
+
+        self.painted = 0
+        if not self.dirty:
+            return []
+        areas = merge_rects(rect.clip(self.rect) for rect in self.dirty)
+        self.dirty = []
+        for area in areas:
+            self.repaint(area)
+        return areas
+
+    def repaint(self, area):
+        camera = self.camera
+        scale = camera.scale
+        width = wire_width(camera.zoom)
+        # selected cables are drawn last so they end up on top
+        lines = []
+        on_top = []
+        drawn = self.drawn
+        # in camera.scale coordinates. the index files cables by their thin
+        # segments, reach is wide enough to catch line ends
+        reach = area.move(camera.x, camera.y).inflate(width * 2, width * 2)
+        for cable in self.board_index.cables_in(camera.world_rect(area.inflate(width * 2, width * 2))):
+            start_pos, end_pos = scale(cable.start_pos), scale(cable.end_pos)
+            if not reach.clipline(start_pos, end_pos):
+                continue
+            color = cable.color()
+            drawn[cable] = (line_rect(start_pos, end_pos, width), color)
+            start_pos, end_pos = self.bounds.clipline(start_pos, end_pos)
+            (on_top if cable.selected else lines).append(
+                (color, (start_pos[0] - camera.x, start_pos[1] - camera.y),
+                 (end_pos[0] - camera.x, end_pos[1] - camera.y)))
+
+        surface = self.surface
+        surface.set_clip(area)
+        surface.fill(CABLE_LAYER_COLORKEY)
+        for color, start_pos, end_pos in lines + on_top:
+            draw_line(surface, color, start_pos, end_pos, width)
+        self.painted += len(lines) + len(on_top)
+        surface.set_clip(None)
+
+    def draw(self, surface):
+        surface.blit(self.surface, self.rect)
@@ -0,0 +1,70 @@
+import math
+import pygame
+from .settings import *
+
+
+# maps board (world) coordinates to the screen. components and cables keep
+# their world positions, panning and zooming only move the camera. zoom
+# snaps to ZOOM_LEVELS so every level reuses the same cached image sizes.
+# the camera position is kept in whole screen pixels, so a pan shifts
+# everything on screen by exactly the distance the mouse moved
+
+class Camera:
+    def __init__(self):
+        # screen position of the world origin, negated
+        self.x = 0
+        self.y = 0
+        self.level = ZOOM_LEVELS.index(1)
+        # bumped on every zoom, pans only change x and y
+        self.version = 0
+
+    @property
+    def zoom(self):
+        return ZOOM_LEVELS[self.level]
+
+    def scale(self, pos):
+        # world point in screen pixels before the pan is applied
+        zoom = self.zoom
+        return (round(pos[0] * zoom), round(pos[1] * zoom))
+
+    def to_screen(self, pos):
+        zoom = self.zoom
+        return (round(pos[0] * zoom) - self.x, round(pos[1] * zoom) - self.y)
+
+    def to_world(self, pos):
+        zoom = self.zoom
+        return (math.floor((pos[0] + self.x) / zoom), math.floor((pos[1] + self.y) / zoom))
+
+    def screen_rect(self, rect):
+        # the size only depends on the zoom, so a component type is always
+        # drawn from the same cached image
+        zoom = self.zoom
+        return pygame.Rect(round(rect[0] * zoom) - self.x, round(rect[1] * zoom) - self.y,
+                           max(1, round(rect[2] * zoom)), max(1, round(rect[3] * zoom)))
+
+    def world_rect(self, rect):
+        zoom = self.zoom
+        left, top = self.to_world(rect[:2])
+        return pygame.Rect(left, top, math.ceil(rect[2] / zoom) + 1, math.ceil(rect[3] / zoom) + 1)
+
+    def pan(self, dx, dy):
+        # by a distance in screen pixels
+        self.x -= dx
+        self.y -= dy
+
+    def zoom_at(self, pos, steps):
+        # zoom in or out by steps levels keeping the world point under pos in place
+        level = min(max(self.level + steps, 0), len(ZOOM_LEVELS) - 1)
+        if level == self.level:
+            return
+        world_x = (pos[0] + self.x) / self.zoom
+        world_y = (pos[1] + self.y) / self.zoom
+        self.level = level
+        self.x = round(world_x * self.zoom) - pos[0]
+        self.y = round(world_y * self.zoom) - pos[1]
+        self.version += 1
+
+    def reset(self):
+        self.x = self.y = 0
+        self.level = ZOOM_LEVELS.index(1)
+        self.version += 1
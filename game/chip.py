@@ -0,0 +1,72 @@
+import numpy as np
+from .settings import CHIP_LUT_MAX_INPUTS
+from .netlist import *
+from .levelized import has_feedback
+from .bitparallel import PATTERNS_PER_WORD, pack_bits, unpack_bits, simulate_patterns
+
+
+# a custom chip is a packaged sub-circuit. its switches become the chip's
+# inputs and its lights the chip's outputs, both left to right. a chip with
+# few inputs is compiled into a lookup table from input pattern (input k is
+# bit k) to output pattern, so every instance is evaluated with one index
+
+MAX_CHIP_OUTPUTS = 64
+
+
+class ChipDefinition:
+    def __init__(self, ops, positions, connections, chips=None):
+        # connections are (source, output index, target, input index) inside the
+        # chip, chips maps nested chip components to their definitions
+        self.ops = list(ops)
+        self.positions = [tuple(position) for position in positions]
+        self.connections = [tuple(connection) for connection in connections]
+        self.chips = dict(chips or {})
+
+        order = sorted(range(len(self.ops)), key=lambda c: (self.positions[c][0], c))
+        self.input_pins = [c for c in order if self.ops[c] == OP_SWITCH]
+        self.output_pins = [c for c in order if self.ops[c] == OP_LIGHT]
+        self.input_count = len(self.input_pins)
+        self.output_count = len(self.output_pins)
+        if not self.output_pins:
+            raise ValueError('a chip needs at least one light as output')
+        if self.output_count > MAX_CHIP_OUTPUTS:
+            raise ValueError(f'a chip can have at most {MAX_CHIP_OUTPUTS} outputs')
+
+        self.netlist = Netlist()
+        self.netlist.compile(self.ops, self.connections, chips=self.chips)
+        if has_feedback(self.netlist):
+            raise ValueError('a chip cannot contain feedback loops')
+        self.output_nets = [self.netlist.input_nets[self.netlist.input_start[light]]
+                            for light in self.output_pins]
+
+        self.lut = lookup_table(self) if self.input_count <= CHIP_LUT_MAX_INPUTS else None
+
+    def evaluate(self, pattern):
+        # output pattern for an input pattern
+        if self.lut is not None:
+            return int(self.lut[pattern])
+        netlist = self.netlist
+        for k, switch in enumerate(self.input_pins):
+            netlist.set_component_output(switch, pattern >> k & 1)
+        # without feedback every gate settles within one tick per level
+        while not netlist.settled():
+            netlist.step()
+        result = 0
+        for j, net in enumerate(self.output_nets):
+            result |= netlist.values[net] << j
+        return result
+
+
+def lookup_table(chip):
+    # every input pattern at once on the bit-parallel simulator
+    count = 1 << chip.input_count
+    patterns = np.arange(count, dtype=np.uint64)
+    stimulus = {switch: pack_bits((patterns >> np.uint64(k)) & np.uint64(1))
+                for k, switch in enumerate(chip.input_pins)}
+    words = -(-count // PATTERNS_PER_WORD)
+    values = simulate_patterns(chip.netlist, stimulus, words)
+
+    lut = np.zeros(count, dtype=np.uint64)
+    for j, net in enumerate(chip.output_nets):
+        lut |= unpack_bits(values[net], count).astype(np.uint64) << np.uint64(j)
+    return lut
@@ -0,0 +1,179 @@
+import mmap
+import struct
+import sys
+from array import array
+from .netlist import OP_CHIP
+
+
+# compact binary circuit file, all little endian:
+#   header       magic, version, component count, cable count, chip definition count
+#   ops          u8 per component, its netlist opcode
+#   states       u8 per component, the state of its first output (switches)
+#   x, y         i32 per component
+#   cables       i32 (output component, output index, input component, input index) per cable
+#   chips        i32 per chip component, its definition in the table below
+#   definitions  per custom chip definition: u32 component count, u32 cable count,
+#                then ops, x, y, cables and chips as above. a definition only
+#                refers to definitions before it
+# every section is a flat array, so a file is read back with a few bulk
+# copies out of a memory map instead of parsing it component by component.
+# version 1 files have no chips and (output, input, input index) cables
+
+MAGIC = b'LGSC'
+VERSION = 2
+PREFIX = struct.Struct('<4sH')
+HEADER = struct.Struct('<4sHxxIII')
+HEADER_V1 = struct.Struct('<4sHxxII')
+DEFINITION = struct.Struct('<II')
+
+
+def is_circuit_file(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def little_endian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def chip_table(chips):
+    # every chip definition used, nested ones before the chips containing them
+    table = {}
+
+    def visit(chip):
+        if chip in table:
+            return
+        for nested in chip.chips.values():
+            visit(nested)
+        table[chip] = len(table)
+
+    for chip in chips.values():
+        visit(chip)
+    return table
+
+
+def circuit_sections(ops, positions, connections, chips, table):
+    x = array('i', (position[0] for position in positions))
+    y = array('i', (position[1] for position in positions))
+    cables = array('i')
+    for connection in connections:
+        cables.extend(connection)
+    refs = array('i', (table[chips[c]] for c, op in enumerate(ops) if op == OP_CHIP))
+    if len(x) != len(ops):
+        raise ValueError('every component needs a position')
+    return bytes(ops), x, y, cables, refs
+
+
+def write_circuit(path, ops, positions, connections, states=None, chips=None):
+    # connections are (output component, output index, input component, input index),
+    # chips maps chip components to definitions with ops, positions,
+    # connections and chips of their own
+    chips = chips or {}
+    table = chip_table(chips)
+    ops, x, y, cables, refs = circuit_sections(ops, positions, connections, chips, table)
+    if states is not None and len(states) != len(ops):
+        raise ValueError('every component needs a state')
+
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(ops), len(cables) // 4, len(table)))
+        file.write(ops)
+        file.write(bytes(states) if states is not None else bytes(len(ops)))
+        for values in (x, y, cables, refs):
+            little_endian(values).tofile(file)
+
+        for chip in table:
+            sections = circuit_sections(chip.ops, chip.positions, chip.connections,
+                                        chip.chips, table)
+            file.write(DEFINITION.pack(len(chip.ops), len(sections[3]) // 4))
+            file.write(sections[0])
+            for values in sections[1:]:
+                little_endian(values).tofile(file)
+
+
+class Reader:
+    # cursor over the memory mapped file
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.offset = 0
+
+    def take(self, size):
+        if self.offset + size > len(self.data):
+            raise ValueError(f'{self.path} is truncated')
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def unpack(self, header):
+        return header.unpack(self.take(header.size))
+
+    def ints(self, count):
+        values = array('i')
+        values.frombytes(self.take(count * 4))
+        return little_endian(values)
+
+    def circuit(self, count, cable_count):
+        ops = self.take(count)
+        return ops, self.ints(count), self.ints(count), self.ints(cable_count * 4)
+
+
+def read_circuit(path, make_chip=None):
+    # returns ops and states (bytes), x and y (int arrays), the flat cable table
+    # of (output, output index, input, input index) and a dict from chip
+    # components to their definitions. definitions are built innermost first
+    # with make_chip(ops, positions, connections, chips)
+    make_chip = make_chip or (lambda *definition: definition)
+    with open(path, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f'{path} is not a circuit file') from None
+        with data:
+            reader = Reader(path, data)
+            if len(data) < PREFIX.size or PREFIX.unpack_from(data)[0] != MAGIC:
+                raise ValueError(f'{path} is not a circuit file')
+            version = PREFIX.unpack_from(data)[1]
+
+            if version == 1:
+                magic, version, count, cable_count = reader.unpack(HEADER_V1)
+                ops = reader.take(count)
+                states = reader.take(count)
+                x, y, triples = reader.ints(count), reader.ints(count), reader.ints(cable_count * 3)
+                cables = array('i')
+                for k in range(0, len(triples), 3):
+                    cables.extend((triples[k], 0, triples[k + 1], triples[k + 2]))
+                return ops, states, x, y, cables, {}
+            if version != VERSION:
+                raise ValueError(f'{path} has unsupported version {version}')
+
+            magic, version, count, cable_count, definition_count = reader.unpack(HEADER)
+            ops = reader.take(count)
+            states = reader.take(count)
+            x, y, cables = reader.ints(count), reader.ints(count), reader.ints(cable_count * 4)
+            refs = reader.ints(ops.count(OP_CHIP))
+
+            definitions = []
+            for _ in range(definition_count):
+                chip_ops, chip_x, chip_y, chip_cables = reader.circuit(*reader.unpack(DEFINITION))
+                chip_refs = reader.ints(chip_ops.count(OP_CHIP))
+                definitions.append(make_chip(
+                    list(chip_ops), list(zip(chip_x, chip_y)), quads(chip_cables),
+                    chip_components(chip_ops, chip_refs, definitions, path)))
+
+    return ops, states, x, y, cables, chip_components(ops, refs, definitions, path)
+
+
+def quads(cables):
+    return list(zip(cables[0::4], cables[1::4], cables[2::4], cables[3::4]))
+
+
+def chip_components(ops, refs, definitions, path):
+    chips = {}
+    for component, ref in zip((c for c, op in enumerate(ops) if op == OP_CHIP), refs):
+        if not 0 <= ref < len(definitions):
+            raise ValueError(f'{path} refers to a missing chip definition')
+        chips[component] = definitions[ref]
+    return chips
@@ -0,0 +1,182 @@
+from functools import lru_cache
+import numpy as np
+from .settings import COMPILED_CACHE_SIZE
+from .netlist import *
+from .levelized import LevelizedNetlist, gate_readers, strongly_connected, MAX_FEEDBACK_ITERATIONS
+
+
+# the gate program as one generated python function. every net is a local
+# variable and every gate one expression, in topological order, so a tick is
+# a single call with no dispatch per gate. feedback loops become a for loop
+# sweeping their gates until they hold still, like the levelized simulator,
+# and are skipped while none of their inputs changed. the function only
+# changes with the topology, it is generated and compiled once per topology
+# and kept for a few of them so undo and redo do not generate it again
+
+EXPRESSIONS = {
+    OP_AND: '{a} & {b}',
+    OP_OR: '{a} | {b}',
+    OP_NOT: '{a} ^ 1',
+    OP_NAND: '({a} & {b}) ^ 1',
+    OP_NOR: '({a} | {b}) ^ 1',
+    OP_XOR: '{a} ^ {b}',
+}
+
+
+def generate_tick(program):
+    # (source, chips by name, gates of every feedback loop) of a function
+    # tick(values, before, sweeps, moving). before is a copy of values from
+    # the start of the tick. sweeps limits the sweeps of every loop, 0 runs
+    # it only if an input computed this tick changed. (loop, nets still
+    # moving) is appended to moving for every loop that did not settle
+    body = []
+    chips = {}
+    loops = []
+    # nets computed by any gate, nets computed by an acyclic gate, which
+    # always are, and per net loaded from values the blocks reading it, None
+    # for the acyclic gates and k for loop k
+    computed = set()
+    acyclic = set()
+    readers = {}
+    stores = []
+
+    def read(net, block=None):
+        if net not in acyclic:
+            readers.setdefault(net, set()).add(block)
+        return f'n{net}'
+
+    def emit(g, indent, block=None):
+        entry = program[g]
+        if entry.__class__ is ChipCall:
+            name = f'chip{g}'
+            chips[name] = entry.chip
+            pattern = ' | '.join(f'{read(net, block)} << {k}' if k else read(net, block)
+                                 for k, net in enumerate(entry.inputs)) or '0'
+            body.append(f'{indent}p = {name}.evaluate({pattern})')
+            outputs = entry.outputs
+            for j, out in enumerate(outputs):
+                body.append(f'{indent}n{out} = p >> {j} & 1' if j else f'{indent}n{out} = p & 1')
+        else:
+            table, a, b, out = entry
+            expression = EXPRESSIONS[TABLE_OPS[table]].format(a=read(a, block), b=read(b, block))
+            body.append(f'{indent}n{out} = {expression}')
+            outputs = (out,)
+        return outputs
+
+    for component in strongly_connected(gate_readers(program)):
+        inputs, outputs = entry_nets(program[component[0]])
+        if len(component) == 1 and not set(inputs) & set(outputs):
+            outputs = emit(component[0], '    ')
+            computed.update(outputs)
+            acyclic.update(outputs)
+            stores.extend(f'    v[{out}] = n{out}' for out in outputs)
+            continue
+
+        # a loop runs if one of its inputs computed this tick differs from
+        # before, values may already hold the outputs of earlier loops. a
+        # loop that does not run keeps its outputs
+        k = len(loops)
+        loops.append(sorted(component))
+        outs = [out for g in loops[k] for out in entry_nets(program[g])[1]]
+        changed = sorted({net for g in loops[k] for net in entry_nets(program[g])[0]
+                          if net in computed and net not in outs})
+        body.append('    if ' + ' or '.join([f'sweeps[{k}]'] + [f'{read(net, k)} != b[{net}]' for net in changed]) + ':')
+        # nets only this loop reads are loaded here, see below
+        body.append(k)
+
+        # a loop reads its own outputs before writing them, the first sweep
+        # starts from the current values
+        current = ''.join(f'{read(out, k)}, ' for out in outs)
+        body.append(f'        for _ in range(sweeps[{k}] or {MAX_FEEDBACK_ITERATIONS}):')
+        body.append(f'            last = ({current})')
+        for g in loops[k]:
+            emit(g, '            ', k)
+        body.append(f'            if last == ({current}):')
+        body.append('                break')
+        body.append('        else:')
+        body.append(f'            moving.append(({k}, moved({tuple(outs)}, last, ({current}))))')
+        body.extend(f'        v[{out}] = n{out}' for out in outs)
+        computed.update(outs)
+
+    # a net read by one loop alone is loaded when that loop runs, so a tick
+    # costs nothing for loops that stay still. the rest is loaded up front
+    loads = []
+    loop_loads = [[] for _ in loops]
+    for net, blocks in readers.items():
+        if len(blocks) == 1 and None not in blocks:
+            loop_loads[next(iter(blocks))].append(f'        n{net} = v[{net}]')
+        else:
+            loads.append(f'    n{net} = v[{net}]')
+    lines = []
+    for line in body:
+        if line.__class__ is int:
+            lines.extend(loop_loads[line])
+        else:
+            lines.append(line)
+
+    source = '\n'.join(['def tick(v, b, sweeps, moving):'] + loads + lines + stores + ['    return'])
+    return source, chips, loops
+
+
+def moved(nets, last, current):
+    # nets of a loop that changed in its last sweep. a comprehension in the
+    # generated function would make compiling it quadratic
+    return [net for net, old, new in zip(nets, last, current) if old != new]
+
+
+def topology(program):
+    # hashable form of the program, chips as (definition, input nets, output nets)
+    return tuple((entry.chip, entry.inputs, entry.outputs) if entry.__class__ is ChipCall else entry
+                 for entry in program)
+
+
+@lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_tick(key):
+    # (code, chips by name, loops) per topology, nothing is generated again
+    # for a topology seen before
+    program = [ChipCall(*entry) if len(entry) == 3 else entry for entry in key]
+    source, chips, loops = generate_tick(program)
+    return compile(source, '<netlist>', 'exec'), chips, loops
+
+
+class CompiledNetlist(LevelizedNetlist):
+    # same results as the levelized simulator, one tick is one call of the
+    # generated function over every gate
+    def levelize(self):
+        code, chips, self.loops = compile_tick(topology(self.program))
+        namespace = dict(chips, moved=moved)
+        exec(code, namespace)
+        self.tick = namespace['tick']
+        self.loop_of = {g: k for k, loop in enumerate(self.loops) for g in loop}
+        self.sweeps = [0] * len(self.loops)
+        self.oscillating_loops = set()
+        self.oscillating = set()
+
+    def step(self):
+        if not self.pending:
+            return []
+        values = self.array
+        snapshot = bytes(self.values)
+        before = np.frombuffer(snapshot, dtype=np.uint8)
+
+        # loops with a pending gate run, a loop known to oscillate gets one
+        # sweep per tick so it is seen toggling
+        sweeps = self.sweeps
+        touched = {self.loop_of[g] for g in self.pending if g in self.loop_of}
+        for k in touched:
+            sweeps[k] = 1 if k in self.oscillating_loops else MAX_FEEDBACK_ITERATIONS
+        moving = []
+        self.tick(self.values, snapshot, sweeps, moving)
+        for k in touched:
+            sweeps[k] = 0
+        self.copy_aliases()
+        self.evaluated += len(self.program)
+
+        # oscillating loops keep moving
+        self.oscillating_loops = {k for k, nets in moving}
+        self.oscillating = {net for k, nets in moving for net in nets}
+        self.pending = {g for k in self.oscillating_loops for g in self.loops[k]}
+
+        changed = np.flatnonzero(before != values).tolist()
+        self.sync(changed)
+        return changed
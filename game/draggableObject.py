@@ -1,33 +1,93 @@
 from enum import Enum
 import pygame
 from .settings import *
+from .netlist import *
+from .image_cache import load_image, scaled_image
+from .ports import PORTS, PortList
 
 
-class DraggableObject(pygame.sprite.Sprite):
+class DraggableObject:
+    # slots and shared images keep a component down to a few pointers, its
+    # ports live in the shared PORTS table and inputs / output are views into it.
+    # the image is only looked up once the component is first drawn
+    __slots__ = ('image_path', '_image', 'rect', 'dragging', 'offset_x', 'offset_y',
+                 'selected', 'port_base', 'input_count', 'output_count')
+    opcode = OP_NONE
+    input_offsets = ()
+    output_offsets = ()
+
     def __init__(self, image_path, width, height):
-        super().__init__()
         self.image_path = image_path
-        self.original_image = pygame.image.load(image_path)
-        self.image = pygame.transform.scale(
-            self.original_image, (width, height))
-        self.rect = self.image.get_rect()
+        self._image = None
+        self.rect = pygame.Rect(0, 0, width, height)
         self.dragging = False
         self.offset_x = 0
         self.offset_y = 0
         self.selected = False
+        self.input_count = len(self.input_offsets)
+        self.output_count = len(self.output_offsets)
+        self.port_base = PORTS.allocate(
+            self.input_offsets + self.output_offsets)
+
+    def __del__(self):
+        if hasattr(self, 'port_base'):
+            PORTS.release(self.port_base,
+                          self.input_count + self.output_count)
+
+    @property
+    def inputs(self):
+        return PortList(PORTS, self.port_base, self.input_count)
+
+    @property
+    def output(self):
+        return PortList(PORTS, self.port_base + self.input_count, self.output_count)
 
+    @property
     def image(self):
-        return self.original_image
+        if self._image is None:
+            self._image = scaled_image(self.image_path, self.rect.size)
+        return self._image
+
+    @property
+    def original_image(self):
+        return load_image(self.image_path)
+
+    def set_image(self, image_path):
+        # swap to a cached image, nothing to do if it is already shown
+        if image_path == self.image_path:
+            return
+        self.image_path = image_path
+        self._image = None
 
     def set_opacity(self, opacity):
+        if opacity == 255:
+            # fully opaque is the shared cached image again
+            self._image = None
+            return
         temp_image = self.original_image.convert_alpha()
         temp_image.fill((255, 255, 255, opacity), None, pygame.BLEND_RGBA_MULT)
-        self.image = pygame.transform.scale(
+        self._image = pygame.transform.scale(
             temp_image, (self.rect.width, self.rect.height))
 
-    def draw_selected_outline(self, surface, outline_color=SELECTION_BOX_OUTLINE_COLOR, outline_width=2):
+    def draw_selected_outline(self, surface, rect, outline_color=SELECTION_BOX_OUTLINE_COLOR, outline_width=2):
+        # rect is where the component is on screen
         if self.selected:
-            pygame.draw.rect(surface, outline_color, self.rect, outline_width)
+            # four filled edges instead of one outline with a width, which
+            # rasterizes differently when only part of the screen is repainted
+            for edge in (
+                    (rect.x, rect.y, rect.width, outline_width),
+                    (rect.x, rect.bottom - outline_width, rect.width, outline_width),
+                    (rect.x, rect.y, outline_width, rect.height),
+                    (rect.right - outline_width, rect.y, outline_width, rect.height)):
+                pygame.draw.rect(surface, outline_color, edge)
+
+    def draw_slots(self, surface, rect, color=(255, 0, 0)):
+        # every input and output port, scaled from the component to rect
+        slot_radius = max(2, 5 * rect.width // self.rect.width)
+        for slot in (*self.inputs, *self.output):
+            slot_pos = (rect.x + slot[0] * rect.width // self.rect.width,
+                        rect.y + slot[1] * rect.height // self.rect.height)
+            pygame.draw.circle(surface, color, slot_pos, slot_radius)
 
     def is_left_clicked(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -63,115 +123,60 @@ class DraggableObject(pygame.sprite.Sprite):
 
 
 class Gate(DraggableObject):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-
-    def draw_slots(self, surface, color=(255, 0, 0)):
-        slot_radius = 5
-        # Draw input slots
-        for input_slot in self.inputs:
-            input_pos = (self.rect.x + input_slot[0],
-                         self.rect.y + input_slot[1])
-            pygame.draw.circle(surface, color, input_pos, slot_radius)
-
-        # Draw output slot
-        output_pos = (self.rect.x + self.output[0][0],
-                      self.rect.y + self.output[0][1])
-        pygame.draw.circle(surface, color, output_pos, slot_radius)
+    __slots__ = ()
+    input_offsets = ((10, 70), (34, 70))
+    output_offsets = ((21, 0),)
 
 
 class AndGate(Gate):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-        self.inputs = [[10, 70, False], [34, 70, False]]
-        self.output = [[21, 0, False]]
-
-    def update_state(self):
-        all_inputs_true = all(input_state[2] for input_state in self.inputs)
-        self.output[0][2] = all_inputs_true
+    __slots__ = ()
+    opcode = OP_AND
 
 
 class OrGate(Gate):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-        self.inputs = [[10, 70, False], [34, 70, False]]
-        self.output = [[21, 0, False]]
-
-    def update_state(self):
-        any_input_true = any(input_state[2] for input_state in self.inputs)
-        self.output[0][2] = any_input_true
+    __slots__ = ()
+    opcode = OP_OR
 
 
 class NotGate(Gate):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-        self.inputs = [[21, 70, False]]
-        self.output = [[21, 0, False]]
-
-    def update_state(self):
-        self.output[0][2] = not self.inputs[0][2]
+    __slots__ = ()
+    opcode = OP_NOT
+    input_offsets = ((21, 70),)
 
 
 class NandGate(Gate):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-        self.inputs = [[10, 70, False], [34, 70, False]]
-        self.output = [[21, 0, False]]
-
-    def update_state(self):
-        self.output[0][2] = not all(input_state[2]
-                                    for input_state in self.inputs)
+    __slots__ = ()
+    opcode = OP_NAND
 
 
 class NorGate(Gate):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-        self.inputs = [[10, 70, False], [34, 70, False]]
-        self.output = [[21, 0, False]]
-
-    def update_state(self):
-        self.output[0][2] = not any(input_state[2]
-                                    for input_state in self.inputs)
+    __slots__ = ()
+    opcode = OP_NOR
 
 
 class XorGate(Gate):
-    def __init__(self, image_path, width, height):
-        super().__init__(image_path, width, height)
-        self.inputs = [[10, 70, False], [34, 70, False]]
-        self.output = [[21, 0, False]]
-
-    def update_state(self):
-        true_inputs = sum(input_state[2] for input_state in self.inputs)
-        self.output[0][2] = true_inputs % 2 == 1
+    __slots__ = ()
+    opcode = OP_XOR
 
 
 class Light(DraggableObject):
+    __slots__ = ('state',)
+    opcode = OP_LIGHT
+    input_offsets = ((21, 70),)
+    on_image_path = 'game/assets/LIGHT_ON.png'
+    off_image_path = 'game/assets/LIGHT_OFF.png'
+
     def __init__(self, image_path, width, height):
         super().__init__(image_path, width, height)
-        self.inputs = [[21, 70, False]]
         self.state = False
-
-        self.on_image_path = 'game/assets/LIGHT_ON.png'
-        self.off_image_path = 'game/assets/LIGHT_OFF.png'
         self.update_image()
 
-    def draw_slots(self, surface, color=(255, 0, 0)):
-        slot_radius = 5
-        # Draw input slots
-        for input_slot in self.inputs:
-            input_pos = (self.rect.x + input_slot[0],
-                         self.rect.y + input_slot[1])
-            pygame.draw.circle(surface, color, input_pos, slot_radius)
-
     def update_state(self):
         self.state = self.inputs[0][2]
         self.update_image()
 
     def update_image(self):
-        self.image_path = self.on_image_path if self.state else self.off_image_path
-        self.original_image = pygame.image.load(self.image_path)
-        self.image = pygame.transform.scale(
-            self.original_image, (self.rect.width, self.rect.height))
+        self.set_image(self.on_image_path if self.state else self.off_image_path)
 
 
 class Color(Enum):
@@ -186,46 +191,23 @@ class Color(Enum):
 
 
 class Led(DraggableObject):
+    __slots__ = ('state',)
+    opcode = OP_LED
+    # yellow - blue - red
+    input_offsets = ((7, 64), (23, 64), (40, 64))
+
     def __init__(self, image_path, width, height):
         super().__init__(image_path, width, height)
-        # yellow - blue - red
-        self.inputs = [[7, 64, False], [23, 64, False], [40, 64, False]]
-
         self.state = Color.BLACK.value
         self.update_image()
 
-    def draw_slots(self, surface, color=(255, 0, 0)):
-        slot_radius = 5
-        # Draw input slots
-        for input_slot in self.inputs:
-            input_pos = (self.rect.x + input_slot[0],
-                         self.rect.y + input_slot[1])
-            pygame.draw.circle(surface, color, input_pos, slot_radius)
-
     def update_state(self):
-        if self.inputs[0][2] and self.inputs[1][2] and self.inputs[2][2]:
-            self.state = Color.WHITE.value
-        elif self.inputs[0][2] and self.inputs[1][2]:
-            self.state = Color.GREEN.value
-        elif self.inputs[2][2] and self.inputs[1][2]:
-            self.state = Color.PURPLE.value
-        elif self.inputs[2][2] and self.inputs[0][2]:
-            self.state = Color.ORANGE.value
-        elif self.inputs[2][2]:
-            self.state = Color.RED.value
-        elif self.inputs[1][2]:
-            self.state = Color.BLUE.value
-        elif self.inputs[0][2]:
-            self.state = Color.YELLOW.value
-        else:
-            self.state = Color.BLACK.value
+        self.state = Color[led_color(
+            [input_state[2] for input_state in self.inputs])].value
         self.update_image()
 
     def update_image(self):
-        self.image_path = self.state
-        self.original_image = pygame.image.load(self.image_path)
-        self.image = pygame.transform.scale(
-            self.original_image, (self.rect.width, self.rect.height))
+        self.set_image(self.state)
 
 
 class Numbers(Enum):
@@ -264,65 +246,71 @@ class Numbers(Enum):
 
 
 class Counter(DraggableObject):
+    __slots__ = ('state',)
+    opcode = OP_COUNTER
+    input_offsets = (
+        (14, 96),  # Represents 1
+        (32, 96),  # Represents 2
+        (50, 96),  # Represents 4
+        (68, 96),  # Represents 8
+        (86, 96))  # Represents 16
+
     def __init__(self, image_path, width, height):
         super().__init__(image_path, width, height)
-        self.inputs = [
-            [14, 96, False],  # Represents 1
-            [32, 96, False],  # Represents 2
-            [50, 96, False],  # Represents 4
-            [68, 96, False],  # Represents 8
-            [86, 96, False]]  # Represents 16
         self.state = Numbers.N_0.value
 
-    def draw_slots(self, surface, color=(255, 0, 0)):
-        slot_radius = 5
-        # Draw input slots
-        for input_slot in self.inputs:
-            input_pos = (self.rect.x + input_slot[0],
-                         self.rect.y + input_slot[1])
-            pygame.draw.circle(surface, color, input_pos, slot_radius)
-
     def update_state(self):
-        binary_state = [input[2]
-                        for input in self.inputs]  # Extract the boolean values
-        decimal_value = binary_state[4] * 16 + binary_state[3] * 8 + \
-            binary_state[2] * 4 + binary_state[1] * 2 + binary_state[0] * 1
+        decimal_value = counter_value(
+            [input_state[2] for input_state in self.inputs])
 
         self.state = getattr(Numbers, f'N_{decimal_value}').value
 
         self.update_image()
 
-        self.update_image()
-
     def update_image(self):
-        self.image_path = self.state
-        self.original_image = pygame.image.load(self.image_path)
-        self.image = pygame.transform.scale(
-            self.original_image, (self.rect.width, self.rect.height))
+        self.set_image(self.state)
 
 
 class Switch(DraggableObject):
+    __slots__ = ()
+    opcode = OP_SWITCH
+    output_offsets = ((21, 0),)
+    on_image_path = 'game/assets/SWITCH_ON.png'
+    off_image_path = 'game/assets/SWITCH_OFF.png'
+
     def __init__(self, image_path, width, height):
         super().__init__(image_path, width, height)
-        self.output = [[21, 0, False]]
-
-        self.on_image_path = 'game/assets/SWITCH_ON.png'
-        self.off_image_path = 'game/assets/SWITCH_OFF.png'
         self.update_image()
 
-    def draw_slots(self, surface, color=(255, 0, 0)):
-        slot_radius = 5
-        # Draw output slot
-        output_pos = (self.rect.x + self.output[0][0],
-                      self.rect.y + self.output[0][1])
-        pygame.draw.circle(surface, color, output_pos, slot_radius)
-
     def update_image(self):
-        self.image_path = self.on_image_path if self.output[0][2] else self.off_image_path
-        self.original_image = pygame.image.load(self.image_path)
-        self.image = pygame.transform.scale(
-            self.original_image, (self.rect.width, self.rect.height))
+        self.set_image(
+            self.on_image_path if self.output[0][2] else self.off_image_path)
 
     def toggle_switch(self):
         self.output[0][2] = not self.output[0][2]
         self.update_image()
+
+
+class Chip(DraggableObject):
+    # a packaged sub-circuit, inputs along the bottom and outputs along the top
+    __slots__ = ('chip',)
+    opcode = OP_CHIP
+    chip_image_path = 'game/assets/DeafaultBOX.png'
+
+    def __init__(self, chip):
+        self.chip = chip
+        pins = max(chip.input_count, chip.output_count)
+        super().__init__(self.chip_image_path, max(50, 20 * (pins + 1)), 70)
+
+    @property
+    def input_offsets(self):
+        return pin_offsets(self.chip.input_count, self.rect.width, self.rect.height)
+
+    @property
+    def output_offsets(self):
+        return pin_offsets(self.chip.output_count, self.rect.width, 0)
+
+
+def pin_offsets(count, width, y):
+    # evenly spaced along one edge
+    return tuple((width * (k + 1) // (count + 1), y) for k in range(count))
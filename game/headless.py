@@ -0,0 +1,181 @@
+import json
+from .settings import SIMULATION_MODE, ANALYZER_BLOCK
+from .netlist import *
+from .levelized import LevelizedNetlist
+from .compiled import CompiledNetlist
+from .bitparallel import truth_table, format_truth_table
+from .chip import ChipDefinition
+from .circuit_file import is_circuit_file, read_circuit, quads
+from .analyzer import LogicAnalyzer
+
+
+# runs a circuit on the netlist alone, no display, sprites or images
+#
+# circuit files are json:
+#   {"components": [{"type": "SWITCH", "x": 10, "y": 60}, ...],
+#    "cables": [[output component, input component, input index], ...]}
+# components are referred to by their position in the list. binary circuit
+# files saved from the editor are read as well
+
+
+def load_circuit(path):
+    if is_circuit_file(path):
+        # custom chips only come from the editor, so only binary files have them
+        ops, states, x, y, cables, chips = read_circuit(path, ChipDefinition)
+        connections = quads(cables)
+        check_cables(ops, connections, chips)
+        return (list(ops), list(zip(x, y)), connections,
+                output_values(ops, states, chips), chips)
+
+    with open(path) as file:
+        data = json.load(file)
+    for component in data['components']:
+        if component['type'] not in OPCODES:
+            raise ValueError(f"unknown component type {component['type']}")
+    ops = [OPCODES[component['type']] for component in data['components']]
+    positions = [(component.get('x', 0), component.get('y', 0))
+                 for component in data['components']]
+    connections = [(source, 0, target, input_index)
+                   for source, target, input_index in data['cables']]
+    check_cables(ops, connections)
+    states = [component.get('state', 0) for component in data['components']]
+    return ops, positions, connections, output_values(ops, states), {}
+
+
+def check_cables(ops, connections, chips=None):
+    # the netlist indexes flat port arrays, an index out of range would
+    # silently wire up a port of the next component. every component needs
+    # a known opcode for its port counts
+    chips = chips or {}
+    for component, op in enumerate(ops):
+        if op not in OPCODE_NAMES:
+            raise ValueError(f'component {component}: unknown opcode {op}')
+        if op == OP_CHIP and component not in chips:
+            raise ValueError(f'component {component}: chip without a definition')
+    for cable, (source, output_index, target, input_index) in enumerate(connections):
+        for component in (source, target):
+            if not 0 <= component < len(ops):
+                raise ValueError(f'cable {cable}: no component {component}')
+        output_count = port_counts(ops[source], chips.get(source))[1]
+        if not 0 <= output_index < output_count:
+            raise ValueError(f'cable {cable}: component {source} has no output {output_index}')
+        input_count = port_counts(ops[target], chips.get(target))[0]
+        if not 0 <= input_index < input_count:
+            raise ValueError(f'cable {cable}: component {target} has no input {input_index}')
+
+
+def output_values(ops, states, chips=None):
+    # initial value of every output net, the state only covers the first output
+    chips = chips or {}
+    return [state if k == 0 else 0
+            for component, (op, state) in enumerate(zip(ops, states))
+            for k in range(port_counts(op, chips.get(component))[1])]
+
+
+def create_netlist(ops, connections, mode=SIMULATION_MODE, values=None, chips=None,
+                   optimize=False, constants=()):
+    # constants are switches that never change, the optimizer folds them in
+    if mode == 'event':
+        netlist = Netlist()
+    else:
+        netlist = CompiledNetlist(optimize) if mode == 'compiled' else LevelizedNetlist(optimize)
+    netlist.compile(ops, connections, values, chips, constants=[(switch, 0) for switch in constants])
+    return netlist
+
+
+def parse_stimulus(assignments):
+    # "ID=VALUE" applies before the first tick, "TICK:ID=VALUE" before that tick
+    stimulus = {}
+    for assignment in assignments:
+        tick, _, change = assignment.rpartition(':')
+        component, equals, value = change.partition('=')
+        try:
+            tick, component = int(tick or 0), int(component)
+        except ValueError:
+            equals = ''
+        if not equals or not value or tick < 0:
+            raise ValueError(f'cannot parse {assignment!r}, expected [TICK:]ID=VALUE')
+        stimulus.setdefault(tick, []).append((component, value not in ('0', 'false')))
+    return stimulus
+
+
+def format_states(netlist, states):
+    return '\n'.join(f'{OPCODE_NAMES[netlist.ops[sink]]} {sink}: {state}'
+                     for sink, state in states.items())
+
+
+def board_probes(netlist):
+    # every switch output and the net driving every sink, for a vcd export
+    probes = {}
+    for component, op in enumerate(netlist.ops):
+        if op == OP_SWITCH:
+            probes[f'switch{component}'] = netlist.output_start[component]
+    for sink in netlist.sinks:
+        start, end = netlist.input_start[sink], netlist.input_start[sink + 1]
+        for k, net in enumerate(netlist.input_nets[start:end]):
+            probes[f'{OPCODE_NAMES[netlist.ops[sink]].lower()}{sink}_{k}'] = net
+    return probes
+
+
+def run_headless(path, assignments=(), ticks=1, mode=SIMULATION_MODE, as_json=False,
+                 trace=False, show_truth_table=False, vcd_path=None, optimize=False):
+    ops, positions, connections, values, chips = load_circuit(path)
+
+    stimulus = parse_stimulus(assignments)
+    for changes in stimulus.values():
+        for component, value in changes:
+            if not 0 <= component < len(ops):
+                raise ValueError(f'no component {component}, the circuit has {len(ops)}')
+            if ops[component] != OP_SWITCH:
+                raise ValueError(f'component {component} is not a switch')
+
+    # a truth table goes through every switch
+    stimulated = {component for changes in stimulus.values() for component, value in changes}
+    constants = [] if show_truth_table else [
+        component for component, op in enumerate(ops) if op == OP_SWITCH and component not in stimulated]
+    netlist = create_netlist(ops, connections, mode, values, chips, optimize, constants)
+
+    if show_truth_table:
+        print(format_truth_table(*truth_table(netlist)))
+        return
+
+    analyzer = None
+    if vcd_path:
+        # the ring only has to hold what the writer has not taken yet
+        probes = board_probes(netlist)
+        analyzer = LogicAnalyzer(depth=2 * ANALYZER_BLOCK, max_probes=len(probes))
+        analyzer.probe(probes.keys(), probes.values())
+        analyzer.attach(netlist.values)
+        analyzer.export(vcd_path)
+
+    history = []
+    for tick in range(ticks):
+        for component, value in stimulus.get(tick, ()):
+            netlist.set_component_output(component, value)
+        netlist.step()
+        if analyzer:
+            analyzer.sample()
+        if trace:
+            history.append({str(sink): state for sink, state in netlist.sink_states().items()})
+            if not as_json:
+                print(f'tick {tick}')
+                print(format_states(netlist, netlist.sink_states()))
+
+    if analyzer:
+        dropped = analyzer.stop_export()
+        if dropped:
+            print(f'vcd: {dropped} ticks dropped')
+
+    states = netlist.sink_states()
+    if as_json:
+        result = {'ticks': ticks, 'sinks': {str(sink): state for sink, state in states.items()}}
+        if trace:
+            result['trace'] = history
+        if netlist.oscillating:
+            result['oscillating'] = netlist.oscillating_components()
+        print(json.dumps(result))
+    else:
+        if not trace:
+            print(format_states(netlist, states))
+        if netlist.oscillating:
+            print(f'oscillating: {netlist.oscillating_components()}')
@@ -0,0 +1,80 @@
+from collections import deque
+from .settings import *
+
+
+# undo and redo as a log of small deltas. every change to the board is
+# recorded as it is made and the deltas of one user action form one step.
+# undoing a step applies the inverse deltas newest first, so it costs as much
+# as the change itself however big the board is. only the last
+# HISTORY_LIMIT steps are kept, with no checkpoints of the whole board, so
+# older steps cannot be undone and the editor says so
+
+CREATE, DELETE, MOVE, CONNECT, DISCONNECT, TOGGLE = range(6)
+INVERSE = {CREATE: DELETE, DELETE: CREATE, CONNECT: DISCONNECT,
+           DISCONNECT: CONNECT, MOVE: MOVE, TOGGLE: TOGGLE}
+
+
+def inverse(delta):
+    kind, item, *args = delta
+    if kind == MOVE:
+        dx, dy = args
+        return MOVE, item, -dx, -dy
+    return (INVERSE[kind], item, *args)
+
+
+class History:
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.undo_steps = deque(maxlen=limit)
+        self.redo_steps = []
+        self.step = []
+        # nothing is recorded while a step is replayed
+        self.replaying = False
+        # whether old steps were dropped for the limit
+        self.truncated = False
+
+    def record(self, kind, item, *args):
+        # create, delete, connect, disconnect and toggle take the component or
+        # cable, move takes the components and the distance moved
+        if not self.replaying:
+            self.step.append((kind, item, *args))
+
+    def commit(self):
+        # closes the current step, a new change drops whatever could be redone
+        if self.step:
+            if len(self.undo_steps) == self.undo_steps.maxlen:
+                self.truncated = True
+            self.undo_steps.append(self.step)
+            self.redo_steps.clear()
+            self.step = []
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.step = []
+        self.truncated = False
+
+    def undo(self, apply):
+        self.commit()
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self.replay(apply, [inverse(delta) for delta in reversed(step)])
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self, apply):
+        self.commit()
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        self.replay(apply, step)
+        self.undo_steps.append(step)
+        return True
+
+    def replay(self, apply, deltas):
+        self.replaying = True
+        try:
+            for delta in deltas:
+                apply(*delta)
+        finally:
+            self.replaying = False
@@ -0,0 +1,39 @@
+from collections import OrderedDict
+import pygame
+from .settings import *
+
+
+# process wide image cache, every sprite showing the same png at the same size
+# shares one surface, so cached surfaces must never be drawn on
+
+originals = {}
+scaled = OrderedDict()
+stats = {'loads': 0, 'scales': 0}
+
+
+def load_image(path):
+    image = originals.get(path)
+    if image is None:
+        image = pygame.image.load(path)
+        originals[path] = image
+        stats['loads'] += 1
+    return image
+
+
+def scaled_image(path, size):
+    key = (path, tuple(size))
+    image = scaled.get(key)
+    if image is not None:
+        scaled.move_to_end(key)
+        return image
+
+    image = pygame.transform.scale(load_image(path), key[1])
+    if pygame.display.get_surface() is not None:
+        # in the display's pixel format blits are several times faster
+        image = image.convert_alpha()
+    stats['scales'] += 1
+    scaled[key] = image
+    # least recently used scaled variants go first
+    while len(scaled) > IMAGE_CACHE_SIZE:
+        scaled.popitem(last=False)
+    return image
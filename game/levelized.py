@@ -0,0 +1,283 @@
+import numpy as np
+from .settings import NETLIST_OPTIMIZE
+from .netlist import *
+from .optimizer import optimize
+
+
+# vectorized gate functions on arrays of 0/1 net values
+NUMPY_OPS = {
+    OP_AND: lambda a, b: a & b,
+    OP_OR: lambda a, b: a | b,
+    OP_NOT: lambda a, b: a ^ 1,
+    OP_NAND: lambda a, b: (a & b) ^ 1,
+    OP_NOR: lambda a, b: (a | b) ^ 1,
+    OP_XOR: lambda a, b: a ^ b,
+}
+
+
+# feedback loops are iterated at most this often per tick before their nets
+# are flagged as oscillating
+MAX_FEEDBACK_ITERATIONS = 64
+
+
+def gate_readers(program):
+    # gate -> gates reading one of its outputs. chips count as a single gate
+    nets = [entry_nets(entry) for entry in program]
+    net_gate = {out: g for g, (inputs, outputs) in enumerate(nets) for out in outputs}
+    readers = [set() for _ in program]
+    for g, (inputs, outputs) in enumerate(nets):
+        for net in inputs:
+            if net in net_gate:
+                readers[net_gate[net]].add(g)
+    return [sorted(r) for r in readers]
+
+
+def strongly_connected(readers):
+    # tarjan's algorithm without recursion, components in topological order
+    count = len(readers)
+    index = [-1] * count
+    low = [0] * count
+    on_stack = [False] * count
+    stack = []
+    components = []
+    counter = 0
+    for root in range(count):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, iter(readers[root]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if index[successor] == -1:
+                    index[successor] = low[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append((successor, iter(readers[successor])))
+                    break
+                if on_stack[successor]:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    # tarjan finishes downstream components first
+    components.reverse()
+    return components
+
+
+def schedule(netlist):
+    # evaluation order of the gate program as (gates, rounds) stages. the
+    # strongly connected components are levelled like single gates: every level
+    # is one stage of independent gates evaluated once, followed by one stage
+    # with the level's feedback loops, which need iterating to a fixed point.
+    # a sweep over the loops goes through their gates one by one, round k
+    # holding the k-th gate of every loop, so a loop sees its own updates
+    # within the sweep and symmetric latches do not race
+    readers = gate_readers(netlist.program)
+    components = strongly_connected(readers)
+    component_of = [0] * len(readers)
+    for c, component in enumerate(components):
+        for g in component:
+            component_of[g] = c
+
+    level = [0] * len(components)
+    for c, component in enumerate(components):
+        for g in component:
+            for reader in readers[g]:
+                if component_of[reader] != c:
+                    level[component_of[reader]] = max(level[component_of[reader]], level[c] + 1)
+
+    levels = [([], []) for _ in range(max(level, default=-1) + 1)]
+    for c, component in enumerate(components):
+        if len(component) > 1 or component[0] in readers[component[0]]:
+            levels[level[c]][1].append(sorted(component))
+        else:
+            levels[level[c]][0].append(component[0])
+
+    stages = []
+    for acyclic, loops in levels:
+        if acyclic:
+            stages.append((sorted(acyclic), []))
+        if loops:
+            rounds = [[loop[k] for loop in loops if k < len(loop)]
+                      for k in range(max(len(loop) for loop in loops))]
+            stages.append((sorted(g for loop in loops for g in loop), rounds))
+    return stages
+
+
+def has_feedback(netlist):
+    return any(rounds for gates, rounds in schedule(netlist))
+
+
+def group_by_op(netlist, gates):
+    # one (op, out, a, b) index array set per gate type. the type comes from
+    # the truth table, the optimizer can turn a gate into a NOT
+    groups = []
+    for op in GATE_OPS:
+        members = [netlist.program[g] for g in gates
+                   if netlist.program[g].__class__ is not ChipCall
+                   and TABLE_OPS[netlist.program[g][0]] == op]
+        if members:
+            groups.append((
+                op,
+                np.array([m[3] for m in members], dtype=np.intp),
+                np.array([m[1] for m in members], dtype=np.intp),
+                np.array([m[2] for m in members], dtype=np.intp),
+            ))
+    return groups
+
+
+def group_chips(netlist, gates):
+    # one (chip, out, inputs) set per chip definition, out and inputs are
+    # (instances, pins) net arrays
+    members = {}
+    for g in gates:
+        entry = netlist.program[g]
+        if entry.__class__ is ChipCall:
+            members.setdefault(entry.chip, []).append(entry)
+    return [(chip,
+             np.array([entry.outputs for entry in entries], dtype=np.intp).reshape(
+                 len(entries), chip.output_count),
+             np.array([entry.inputs for entry in entries], dtype=np.intp).reshape(
+                 len(entries), chip.input_count))
+            for chip, entries in members.items()]
+
+
+def chip_patterns(chip, bits):
+    # input bits (..., pins, patterns) -> output bits (..., pins, patterns),
+    # one table lookup per pattern when the chip has a lookup table
+    shifts = np.arange(chip.input_count, dtype=np.uint64).reshape(-1, 1)
+    index = (bits.astype(np.uint64) << shifts).sum(axis=-2, dtype=np.uint64)
+    if chip.lut is not None:
+        result = chip.lut[index]
+    else:
+        result = np.vectorize(lambda pattern: chip.evaluate(int(pattern)),
+                              otypes=[np.uint64])(index)
+    shifts = np.arange(chip.output_count, dtype=np.uint64).reshape(-1, 1)
+    return ((np.expand_dims(result, -2) >> shifts) & np.uint64(1)).astype(np.uint8)
+
+
+def chip_outputs(chip, bits):
+    # input bits (instances, pins) -> output bits (instances, pins)
+    return chip_patterns(chip, bits[..., None])[..., 0]
+
+
+class LevelizedNetlist(Netlist):
+    # evaluates the schedule stage by stage with one numpy operation per gate
+    # type. combinational logic settles within a single tick, feedback loops
+    # are iterated until they hold still, so latches settle in one tick too.
+    # stages none of whose inputs changed are skipped
+    def __init__(self, optimize=NETLIST_OPTIMIZE):
+        super().__init__()
+        self.optimize = optimize
+        self.alias_nets = self.alias_sources = np.zeros(0, dtype=np.intp)
+
+    def compile(self, ops, connections, values=None, chips=None, observed=None, constants=()):
+        super().compile(ops, connections, values, chips)
+        self.array = np.frombuffer(self.values, dtype=np.uint8)
+        if self.optimize:
+            nets = lambda outputs: [self.output_start[c] + k for c, k in outputs]
+            optimize(self, strongly_connected(gate_readers(self.program)),
+                     nets(observed or ()), nets(constants))
+        self.alias_nets = np.fromiter(self.aliases.keys(), dtype=np.intp, count=len(self.aliases))
+        self.alias_sources = np.fromiter(self.aliases.values(), dtype=np.intp, count=len(self.aliases))
+        self.copy_aliases()
+        self.levelize()
+
+    def levelize(self):
+        # the schedule as numpy index arrays per stage
+        self.stages = []
+        for gates, rounds in schedule(self):
+            cyclic = bool(rounds)
+            rounds = [(
+                [(NUMPY_OPS[op], out, a, b) for op, out, a, b in group_by_op(self, members)],
+                group_chips(self, members)) for members in (rounds or [gates])]
+            outs = np.concatenate([out for groups, chips in rounds for fn, out, a, b in groups]
+                                  + [out.ravel() for groups, chips in rounds
+                                     for chip, out, inputs in chips])
+            self.stages.append((set(gates), outs, rounds, cyclic))
+        self.oscillating_stages = set()
+        self.oscillating = set()
+
+    def step(self):
+        if not self.pending:
+            return []
+        values = self.array
+        before = values.copy()
+        dirty = self.pending
+        fanout = self.fanout
+        for k, (gates, outs, rounds, cyclic) in enumerate(self.stages):
+            if dirty.isdisjoint(gates):
+                continue
+            previous = values[outs]
+            if not cyclic:
+                evaluate(values, *rounds[0])
+                self.evaluated += len(gates)
+            else:
+                self.iterate(k, gates, outs, rounds)
+            for net in outs[previous != values[outs]].tolist():
+                dirty.update(fanout[net])
+        self.copy_aliases()
+
+        changed = np.flatnonzero(before != values).tolist()
+        # oscillating loops keep moving, one sweep per tick
+        self.pending = set()
+        for k in self.oscillating_stages:
+            self.pending.update(self.stages[k][0])
+        self.sync(changed)
+        return changed
+
+    def set_component_output(self, component, value, output_index=0):
+        super().set_component_output(component, value, output_index)
+        self.sync(self.copy_aliases())
+
+    def copy_aliases(self):
+        # nets the optimizer folded into another net follow it, returns the
+        # ones that changed
+        if not len(self.alias_nets):
+            return []
+        values = self.array
+        previous = values[self.alias_nets]
+        values[self.alias_nets] = values[self.alias_sources]
+        return self.alias_nets[previous != values[self.alias_nets]].tolist()
+
+    def iterate(self, k, gates, outs, rounds):
+        # sweep a stage of feedback loops until it holds still. a loop known
+        # to oscillate gets one sweep per tick so it is seen toggling
+        sweeps = 1 if k in self.oscillating_stages else MAX_FEEDBACK_ITERATIONS
+        values = self.array
+        for _ in range(sweeps):
+            last = values[outs]
+            for groups, chips in rounds:
+                evaluate(values, groups, chips)
+            self.evaluated += len(gates)
+            if np.array_equal(last, values[outs]):
+                self.oscillating_stages.discard(k)
+                self.oscillating.difference_update(outs.tolist())
+                return
+        self.oscillating_stages.add(k)
+        self.oscillating.update(outs[last != values[outs]].tolist())
+
+
+def evaluate(values, groups, chips):
+    # gates of one level or round do not read each other, so they can be
+    # written in place
+    for fn, out, a, b in groups:
+        values[out] = fn(values[a], values[b])
+    for chip, out, inputs in chips:
+        values[out] = chip_outputs(chip, values[inputs])
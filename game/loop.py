@@ -1,32 +1,101 @@
+import time
 import pygame
 from .settings import *
 from .draggableObject import *
 from .button import *
 from .selectionBox import SelectionBox
-from .cable import Cable
-import numpy as np
+from .alert_handler import AlertHandler
+from .profiler import FrameProfiler, ProfilerOverlay
+from .cable import Cable, CableLayer, draw_line, wire_width
+from .camera import Camera
+from .image_cache import scaled_image
+from .renderer import Renderer, line_rect
+from .spatial import BoardIndex
+from .scheduler import TickScheduler
+from .netlist import Netlist
+from .levelized import LevelizedNetlist
+from .compiled import CompiledNetlist
+from .bitparallel import truth_table, format_truth_table
+from .circuit_file import read_circuit, write_circuit, quads
+from .chip import ChipDefinition
+from .history import *
+from .analyzer import LogicAnalyzer
+from .waveform import WaveformPanel
+from .headless import check_cables
 
 
 class Loop:
-    def __init__(self) -> None:
+    def __init__(self, circuit_path=CIRCUIT_FILE, profile_path=None) -> None:
         # Initialize the main game window
         self.display_surface = pygame.display.get_surface()
 
-        # Groups for managing sprites and draggable objects
+        # Sprite group for the buttons, components are plain slotted objects.
+        # components, cables and the selection are dicts used as ordered sets,
+        # so adding and removing is O(1) and the order stays deterministic
         self.all_sprites = pygame.sprite.Group()
-        self.draggable_objects = []
+        self.draggable_objects = {}
 
         # Variables for handling object dragging and selection
         self.currently_dragged_object = None
         self.selection_box = None
-        self.selected_objects = []
+        self.selected_objects = {}
+        self.selected_cables = {}
         self.mouse_start_pos = None
+        # how far the selection or the dragged object moved in this drag, for undo
+        self.drag_distance = (0, 0)
+        self.drag_origin = None
+
+        # World coordinates of the board to the screen, panned with the
+        # middle mouse button and zoomed with the wheel
+        self.camera = Camera()
+        self.camera_view = (self.camera.version, self.camera.x, self.camera.y)
+        self.pan_start = None
 
         # Cable creation mode and storage
         self.cable_mode = False
-        self.cables = []
+        self.cables = {}
         self.current_cable = None
 
+        # Grid index over objects, ports and cables for hit-testing
+        self.board_index = BoardIndex()
+
+        # Redraws only the dirty parts of the screen
+        self.renderer = Renderer(self.display_surface)
+
+        # All connected cables, pre-rendered and redrawn only where they change
+        self.cable_layer = CableLayer(self.board_index, self.camera, self.display_surface.get_size())
+
+        # Undo and redo of every change to the board
+        self.history = History()
+
+        # Compiled simulation, rebuilt only when the topology changes
+        self.netlist = {'levelized': LevelizedNetlist, 'compiled': CompiledNetlist}.get(SIMULATION_MODE, Netlist)()
+        self.topology_changed = True
+
+        # Outputs marked as probes with P, (component, output index) -> label.
+        # their values are recorded every tick, shown in the waveform panel
+        # and exported to a vcd file with Ctrl+E
+        self.probes = {}
+        self.probe_count = 0
+        self.analyzer = LogicAnalyzer()
+        self.waveform_panel = WaveformPanel(self.analyzer)
+
+        # Ticks at SIMULATION_TICK_RATE whatever the frame rate
+        self.scheduler = TickScheduler()
+        # when the screen was last drawn, see run
+        self.last_render = 0.0
+        self.oscillating = []
+
+        # Circuit file for Ctrl+S / Ctrl+O
+        self.circuit_path = circuit_path
+
+        # Message shown at the bottom of the screen for a few seconds
+        self.alert = None
+
+        # Per phase timings, shown with F3 and optionally written to a file
+        self.profiler = FrameProfiler(path=profile_path)
+        self.profiler_overlay = ProfilerOverlay(self.profiler)
+
         # Setup the interface buttons
         self.buttons = [
             # Logic gates
@@ -51,91 +120,254 @@ class Loop:
             self.all_sprites.add(button)
 
     def run(self, dt, events):  # Updated every frame
+        profiler = self.profiler
+
         # Handle any input events
-        self.handle_events(events)
+        with profiler.phase('events'):
+            self.handle_events(events)
+
+        # Simulate the ticks due since the last frame
+        with profiler.phase('simulate'):
+            evaluated = self.netlist.evaluated
+            self.simulate(self.scheduler.advance(dt))
+            profiler.count('gates', self.netlist.evaluated - evaluated)
+
+        # while the simulation is behind its time goes to ticks, the screen
+        # is only drawn often enough to stay responsive
+        now = time.perf_counter()
+        if self.scheduler.behind() and now - self.last_render < 1 / MIN_FPS:
+            return []
+        self.last_render = now
+
+        with profiler.phase('cables'):
+            self.follow_camera()
+            self.cable_layer.touch(self.netlist.redraw_cables)
+            self.netlist.redraw_cables.clear()
+            cable_areas = self.cable_layer.refresh()
+        if self.alert:
+            self.alert.update()
+            if not self.alert.visible:
+                self.alert = None
+
+        # Only repaint what changed, returns the rects to push to the display
+        with profiler.phase('render'):
+            dirty_rects = self.renderer.render(self.render_items(), cable_areas)
+            profiler.count('cables_drawn', self.cable_layer.painted)
+        return dirty_rects
+
+    def follow_camera(self):
+        # a zoom redraws everything, a pan scrolls what is already drawn
+        camera = self.camera
+        version, x, y = self.camera_view
+        if camera.version != version:
+            self.renderer.invalidate()
+            self.cable_layer.invalidate()
+        elif (camera.x, camera.y) != (x, y):
+            self.renderer.scroll(x - camera.x, y - camera.y, keep=(self.cable_layer,))
+            self.cable_layer.scroll(x - camera.x, y - camera.y)
+        self.camera_view = (camera.version, camera.x, camera.y)
+
+    def idle_timeout(self):
+        # None while the simulation or a drag is still moving, otherwise how
+        # many ms the main loop may sleep waiting for input, 0 for no limit
+        if self.topology_changed or not self.netlist.settled() or self.scheduler.behind():
+            return None
+        if self.mouse_start_pos or self.pan_start or (self.currently_dragged_object
+                                    and self.currently_dragged_object.dragging):
+            return None
+        if self.alert:
+            # wake up in time to take the alert down
+            return max(1, self.alert.remaining())
+        return 0
+
+    def show_alert(self, message, alert_type='info'):
+        self.alert = AlertHandler(message, alert_type, (WIDTH // 2, HEIGHT - 30))
+
+    def simulate(self, ticks):
+        # run up to the given number of ticks on the compiled netlist, ticks
+        # left over once the frame's time budget is spent go back to the
+        # scheduler for the next frame
+        if self.topology_changed:
+            self.build_netlist()
+        deadline = time.perf_counter() + SIMULATION_TIME_BUDGET
+        for tick in range(ticks):
+            if self.netlist.settled():
+                # the probes hold their values for the rest of the ticks
+                self.analyzer.sample(ticks - tick)
+                break
+            self.netlist.step()
+            self.analyzer.sample()
+            if time.perf_counter() > deadline:
+                self.scheduler.defer(ticks - tick - 1)
+                break
 
-        # Clear the screen and redraw all sprites
-        self.display_surface.fill(BACKGROUND_COLOR)
-        self.all_sprites.draw(self.display_surface)
+        # tell once when a feedback loop starts oscillating
+        oscillating = self.netlist.oscillating_components()
+        if oscillating and not self.oscillating:
+            self.show_alert(f'feedback loop does not settle: components {oscillating}', 'error')
+        self.oscillating = oscillating
+
+    def build_netlist(self):
+        self.netlist.build(self.draggable_objects, self.cables, self.probes)
+        self.topology_changed = False
+        # probes on deleted components go with them
+        probes = {probe: label for probe, label in self.probes.items()
+                  if probe[0] in self.netlist.index}
+        if len(probes) != len(self.probes):
+            self.probes = probes
+            self.analyzer.probe(probes.values(), self.probe_nets())
+        self.analyzer.attach(self.netlist.values, self.probe_nets())
+
+    def probe_nets(self):
+        netlist = self.netlist
+        return [netlist.output_start[netlist.index[obj]] + output_index
+                for obj, output_index in self.probes]
+
+    def toggle_probes(self):
+        # probes the outputs of the selected components and of the cables'
+        # sources, or removes them when they are all probed already
+        targets = [(obj, k) for obj in self.selected_objects for k in range(obj.output_count)]
+        targets += [(cable.output_obj, cable.output_index) for cable in self.selected_cables]
+        if not targets:
+            return
+        if self.topology_changed:
+            self.build_netlist()
+        probes = dict(self.probes)
+        if all(target in probes for target in targets):
+            for target in targets:
+                probes.pop(target, None)
+        else:
+            for obj, output_index in targets:
+                if (obj, output_index) not in probes:
+                    self.probe_count += 1
+                    label = f'{OPCODE_NAMES[obj.opcode].lower()}{self.probe_count}'
+                    if obj.output_count > 1:
+                        label += f'_{output_index}'
+                    probes[(obj, output_index)] = label
+
+        exporting = self.analyzer.exporting
+        previous, self.probes = self.probes, probes
+        try:
+            self.analyzer.probe(probes.values(), self.probe_nets())
+        except ValueError as error:
+            self.probes = previous
+            self.show_alert(str(error), 'error')
+            return
+        if self.netlist.optimize:
+            # the optimizer may have dropped a gate nobody was watching
+            self.build_netlist()
+        if exporting:
+            self.show_alert(f'probes changed, waveform saved to {VCD_FILE}', 'success')
+
+    def toggle_export(self):
+        if self.analyzer.exporting:
+            dropped = self.analyzer.stop_export()
+            message = f'waveform saved to {VCD_FILE}'
+            if dropped:
+                message += f', {dropped} ticks dropped'
+            self.show_alert(message, 'success')
+        elif not self.probes:
+            self.show_alert('nothing to record, select components and press P to probe them', 'error')
+        else:
+            self.analyzer.export(VCD_FILE)
+            self.show_alert(f'recording waveform to {VCD_FILE}')
+
+    def render_items(self):
+        # (key, rect, version, draw) for everything on screen, in drawing order
+        items = [(button, button.rect, id(button.image), draw_sprite)
+                 for button in self.buttons]
+
+        # only what is in view, in creation order. the margin covers the
+        # outlines and slots drawn around a component
+        camera = self.camera
+        view = camera.world_rect(self.display_surface.get_rect().inflate(24, 24))
+        for obj in sorted(self.board_index.objects_in(view), key=self.board_index.order.get):
+            items.append((obj, camera.screen_rect(obj.rect).inflate(12, 12),
+                          (obj.image_path, obj.dragging, obj.selected, self.cable_mode),
+                          self.draw_object))
+
+        if self.alert:
+            items.append((self.alert, self.alert.rect.inflate(20, 10), None, AlertHandler.draw))
+
+        if self.probes:
+            analyzer = self.analyzer
+            items.append((self.waveform_panel, self.waveform_panel.rect,
+                          (analyzer.tick, analyzer.start, tuple(analyzer.labels)), WaveformPanel.draw))
+
+        if self.profiler.enabled:
+            items.append((self.profiler_overlay, self.profiler_overlay.rect,
+                          self.profiler_overlay.lines(), ProfilerOverlay.draw))
 
         # If a selection box is active, draw it
         if self.selection_box and self.selection_box.visible:
-            self.selection_box.draw(self.display_surface)
+            items.append((self.selection_box, camera.screen_rect(self.selection_box.rect).inflate(2, 2),
+                          None, self.draw_selection_box))
 
-        for obj in self.draggable_objects:
-            if isinstance(obj, (Gate, Light, Led, Counter)):
-                obj.update_state()
+        # Draw all cables and the currently being drawn cable, if any. the
+        # layer reports its own changes, so it is never dirty as an item
+        items.append((self.cable_layer, self.cable_layer.rect, None, CableLayer.draw))
+        if self.current_cable:
+            start_pos = camera.to_screen(self.current_cable.start_pos)
+            end_pos = camera.to_screen(self.current_cable.end_pos)
+            items.append((self.current_cable, line_rect(start_pos, end_pos, wire_width(camera.zoom)),
+                          None, self.draw_cable))
+        return items
+
+    def draw_object(self, obj, surface):
+        zoom = self.camera.zoom
+        rect = self.camera.screen_rect(obj.rect)
+        if zoom < LOD_IMAGE_ZOOM:
+            # far out a component is just a box
+            surface.fill(LOD_COMPONENT_COLOR, rect)
+        elif rect.size == obj.rect.size:
+            surface.blit(obj.image, rect)
+        elif obj.dragging:
+            # the see-through image of a dragged component is not cached
+            surface.blit(pygame.transform.scale(obj.image, rect.size), rect)
+        else:
+            surface.blit(scaled_image(obj.image_path, rect.size), rect)
+        obj.draw_selected_outline(surface, rect)
 
-            obj.draw_selected_outline(self.display_surface)
+        # If in cable mode, draw connection points unless zoomed far out
+        if self.cable_mode and zoom >= LOD_SLOT_ZOOM:
+            obj.draw_slots(surface, rect)
 
-        # If in cable mode, draw connection points on applicable objects
-        if self.cable_mode:
-            for obj in self.all_sprites:
-                if isinstance(obj, (Gate, Switch, Light, Led, Counter)):
-                    obj.draw_slots(self.display_surface)
+    def draw_cable(self, cable, surface):
+        camera = self.camera
+        draw_line(surface, cable.color(), camera.to_screen(cable.start_pos),
+                  camera.to_screen(cable.end_pos), wire_width(camera.zoom))
 
-        # Draw all cables and the currently being drawn cable, if any
-        for cable in self.cables:
-            cable.update()
-            cable.update_state()
-            cable.draw(self.display_surface)
-        if self.current_cable:
-            self.current_cable.draw(self.display_surface)
+    def draw_selection_box(self, box, surface):
+        box.draw(surface, self.camera.screen_rect(box.rect))
 
     def create_draggable_object(self, object_type):
-        if object_type == 'AND':
-            new_object = AndGate(
-                image_path='game/assets/AndGate.png', width=42, height=70)
-        elif object_type == 'OR':
-            new_object = OrGate(
-                image_path='game/assets/OrGate.png', width=42, height=70)
-        elif object_type == 'NOT':
-            new_object = NotGate(
-                image_path='game/assets/NotGate.png', width=42, height=70)
-        elif object_type == 'NAND':
-            new_object = NandGate(
-                image_path='game/assets/NandGate.png', width=42, height=70)
-        elif object_type == 'NOR':
-            new_object = NorGate(
-                image_path='game/assets/NorGate.png', width=42, height=70)
-        elif object_type == 'XOR':
-            new_object = XorGate(
-                image_path='game/assets/XorGate.png', width=42, height=70)
-        elif object_type == 'LIGHT':
-            new_object = Light(
-                image_path='game/assets/LIGHT_OFF.png', width=42, height=70)
-        elif object_type == 'LED':
-            new_object = Led(
-                image_path='game/assets/LED_BLACK.png', width=46, height=64)
-        elif object_type == 'SWITCH':
-            new_object = Switch(
-                image_path='game/assets/SWITCH_OFF.png', width=42, height=70)
-        elif object_type == 'COUNTER':
-            new_object = Counter(
-                image_path='game/assets/Counter/0.png', width=98, height=96)
-        else:
-            new_object = DraggableObject(
-                image_path='game/assets/DeafaultBOX.png', width=50, height=50)
-
+        new_object = make_component(object_type)
         new_object.rect.x = 10
         new_object.rect.y = 60
-        self.draggable_objects.append(new_object)
-        self.all_sprites.add(new_object)
+        self.add_object(new_object)
+
+    def deselect_all(self):
+        for obj in self.selected_objects:
+            obj.selected = False
+        for cable in self.selected_cables:
+            cable.selected = False
+        self.cable_layer.touch(self.selected_cables)
+        self.selected_objects = {}
+        self.selected_cables = {}
 
     def select_multiple(self, event):
-        for all_obj in self.draggable_objects:
-            all_obj.selected = False
-        for all_cable in self.cables:
-            all_cable.selected = False
+        self.deselect_all()
 
-        self.selected_objects = [
-            obj for obj in self.draggable_objects if self.selection_box.rect.colliderect(obj.rect)]
+        self.selected_objects = dict.fromkeys(self.board_index.objects_in(self.selection_box.rect))
         for selected_obj in self.selected_objects:
             selected_obj.selected = True
 
-        for cable in self.cables:
-            if cable.intersects_rect(self.selection_box.rect):
-                cable.selected = True
+        self.selected_cables = dict.fromkeys(
+            cable for cable in self.board_index.cables_in(self.selection_box.rect)
+            if cable.intersects_rect(self.selection_box.rect))
+        for cable in self.selected_cables:
+            cable.selected = True
+        self.cable_layer.touch(self.selected_cables)
 
     def button_click(self, event):
         for button in self.buttons:
@@ -144,71 +376,95 @@ class Loop:
                 if isinstance(button, CableButton):
                     button.toggle(event)
                     self.cable_mode = button.mode
+                elif button.getName() == 'BOX' and self.selected_objects:
+                    self.package_selected_objects()
                 elif button.getName() != '':
                     self.create_draggable_object(button.getName())
                 break
 
     def cable_click(self, event):
-        for cable in self.cables:
-            if cable.is_left_clicked(event):
-                cable.selected = True
-                return True
+        if event.type != pygame.MOUSEBUTTONDOWN or event.button != 1:
+            return False
+        cable = self.board_index.cable_at(event.pos, 5 / self.camera.zoom)
+        if cable is not None:
+            cable.selected = True
+            self.selected_cables[cable] = None
+            self.cable_layer.touch((cable,))
+            return True
+        return False
+
+    def pan(self, event):
+        # middle mouse drag moves the camera, not the board. event is in screen pixels
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 2:
+            self.pan_start = event.pos
+            return True
+        if event.type == pygame.MOUSEMOTION and self.pan_start and event.buttons[1]:
+            self.camera.pan(event.pos[0] - self.pan_start[0], event.pos[1] - self.pan_start[1])
+            self.pan_start = event.pos
+            return True
+        if event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+            self.pan_start = None
+            return True
         return False
 
+    def zoom(self, event):
+        if event.type == pygame.MOUSEWHEEL and event.y:
+            self.camera.zoom_at(pygame.mouse.get_pos(), 1 if event.y > 0 else -1)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_HOME:
+            self.camera.reset()
+
+    def board_event(self, event):
+        # mouse events with their position in world coordinates
+        if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION):
+            return pygame.event.Event(event.type, event.dict, pos=self.camera.to_world(event.pos))
+        return event
+
     def drag(self, event):
         interaction_occurred = False
 
-        # Middle mouse button drag for all objects
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 2:
-            self.mouse_start_pos = event.pos
-            interaction_occurred = True
+        # drag selected obj
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if any(obj.is_left_clicked(event) for obj in self.selected_objects):
+                self.mouse_start_pos = event.pos
+                self.drag_distance = (0, 0)
+                interaction_occurred = True
 
-            # Middle mouse button held
-        elif event.type == pygame.MOUSEMOTION and self.mouse_start_pos and event.buttons[1]:
+        elif event.type == pygame.MOUSEMOTION and self.mouse_start_pos:
             dx = event.pos[0] - self.mouse_start_pos[0]
             dy = event.pos[1] - self.mouse_start_pos[1]
-            for obj in self.draggable_objects:
+            for obj in self.selected_objects:
                 obj.rect.x += dx
                 obj.rect.y += dy
+                self.move_object(obj)
             self.mouse_start_pos = event.pos
+            self.drag_distance = (self.drag_distance[0] + dx, self.drag_distance[1] + dy)
             interaction_occurred = True
 
-            # Middle mouse button lifted
-        elif event.type == pygame.MOUSEBUTTONUP and event.button == 2:
-            self.mouse_start_pos = None
-            interaction_occurred = True
+        elif event.type == pygame.MOUSEBUTTONUP:
+            if self.mouse_start_pos:
+                self.mouse_start_pos = None
+                if self.drag_distance != (0, 0):
+                    self.history.record(MOVE, tuple(self.selected_objects), *self.drag_distance)
+                interaction_occurred = True
 
-            # drag selected obj
+            # drag single obj
         if not interaction_occurred:
             if event.type == pygame.MOUSEBUTTONDOWN:
-                if any(obj.is_left_clicked(event) for obj in self.selected_objects):
-                    self.mouse_start_pos = event.pos
+                hits = self.board_index.objects_at(event.pos)
+                if hits:
+                    self.currently_dragged_object = hits[0]
+                    self.drag_origin = hits[0].rect.topleft
+                    hits[0].handle_event(event)
                     interaction_occurred = True
-
-            elif event.type == pygame.MOUSEMOTION and self.mouse_start_pos:
-                dx = event.pos[0] - self.mouse_start_pos[0]
-                dy = event.pos[1] - self.mouse_start_pos[1]
-                for obj in self.selected_objects:
-                    obj.rect.x += dx
-                    obj.rect.y += dy
-                self.mouse_start_pos = event.pos
+            elif self.currently_dragged_object and self.currently_dragged_object.dragging:
+                obj = self.currently_dragged_object
+                obj.handle_event(event)
+                self.move_object(obj)
+                if not obj.dragging and obj.rect.topleft != self.drag_origin:
+                    self.history.record(MOVE, (obj,), obj.rect.x - self.drag_origin[0],
+                                        obj.rect.y - self.drag_origin[1])
                 interaction_occurred = True
 
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if self.mouse_start_pos:
-                    self.mouse_start_pos = None
-                    interaction_occurred = True
-
-            # drag single obj
-        if not interaction_occurred:
-            for obj in self.draggable_objects:
-                if obj.dragging or (event.type == pygame.MOUSEBUTTONDOWN and obj.rect.collidepoint(event.pos)):
-                    if event.type == pygame.MOUSEBUTTONDOWN:
-                        self.currently_dragged_object = obj
-                    if self.currently_dragged_object == obj:
-                        obj.handle_event(event)
-                        interaction_occurred = True
-
             # select_multiple objs
         if not interaction_occurred and event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self.selection_box = SelectionBox(event.pos[0], event.pos[1])
@@ -222,103 +478,177 @@ class Loop:
             self.select_multiple(event)
             self.selection_box.visible = False
 
+    def move_object(self, obj):
+        self.board_index.move_object(obj)
+        self.cable_layer.touch(self.board_index.attached_cables(obj))
+
+    def add_cable(self, cable):
+        # an input is driven by one cable, a new one replaces the old
+        previous = self.board_index.input_cable(cable.input_obj, cable.input_index)
+        if previous is not None:
+            self.remove_cable(previous)
+        self.cables[cable] = None
+        self.board_index.add_cable(cable)
+        self.cable_layer.add(cable)
+        self.history.record(CONNECT, cable)
+        self.topology_changed = True
+
+    def remove_cable(self, cable):
+        del self.cables[cable]
+        self.board_index.remove_cable(cable)
+        self.cable_layer.remove(cable)
+        self.history.record(DISCONNECT, cable)
+        self.topology_changed = True
+
+    def add_object(self, obj):
+        self.draggable_objects[obj] = None
+        self.board_index.add_object(obj)
+        self.history.record(CREATE, obj)
+        self.topology_changed = True
+
+    def remove_object(self, obj):
+        # its cables go with it
+        for cable in list(self.board_index.attached_cables(obj)):
+            self.remove_cable(cable)
+        del self.draggable_objects[obj]
+        self.board_index.remove_object(obj)
+        self.history.record(DELETE, obj)
+        self.topology_changed = True
+
+    def apply_delta(self, kind, item, *args):
+        # replays one recorded change, restored items come back unselected
+        if kind == CREATE:
+            item.selected = False
+            self.add_object(item)
+        elif kind == DELETE:
+            self.remove_object(item)
+        elif kind == CONNECT:
+            item.selected = False
+            self.add_cable(item)
+        elif kind == DISCONNECT:
+            self.remove_cable(item)
+        elif kind == MOVE:
+            dx, dy = args
+            for obj in item:
+                obj.rect.move_ip(dx, dy)
+                self.move_object(obj)
+        elif kind == TOGGLE:
+            item.toggle_switch()
+            self.netlist.set_output(item, item.output[0][2])
+
+    def undo(self):
+        self.deselect_all()
+        self.currently_dragged_object = None
+        if not self.history.undo(self.apply_delta) and self.history.truncated:
+            self.show_alert(f'only the last {HISTORY_LIMIT} steps can be undone', 'error')
+
+    def redo(self):
+        self.deselect_all()
+        self.currently_dragged_object = None
+        self.history.redo(self.apply_delta)
+
     def delete_selected_objects(self):
         # Delete selected cables
-        for cable in self.cables[:]:  # Iterate over a copy of the cables list
-            if cable.selected:
-                self.cables.remove(cable)
+        for cable in self.selected_cables:
+            if cable in self.cables:
+                self.remove_cable(cable)
 
         # Delete selected draggable objects
-        for sprite in list(self.all_sprites):
-            if hasattr(sprite, 'selected') and sprite.selected:
-                self.draggable_objects.remove(sprite)
-                self.all_sprites.remove(sprite)
+        for obj in self.selected_objects:
+            self.remove_object(obj)
+
+        # Drop the references so the deleted ports can be reused
+        self.selected_objects.clear()
+        self.selected_cables.clear()
+        self.topology_changed = True
 
     def duplicate_selected_objects(self):
+        # copies the selection with the cables between the selected objects,
+        # the copies start with fresh ports and only switches keep their state
         offset_x = 20
         offset_y = 20
-        duplicates = []
-
+        copies = {}
         for obj in self.selected_objects:
-            # Use the type of the current object to create a new instance
-            duplicate = type(obj)(
-                image_path=obj.image_path, width=obj.rect.width, height=obj.rect.height)
-
-            if hasattr(obj, 'inputs'):
-                duplicate.inputs = obj.inputs.copy()
-            if hasattr(obj, 'output'):
-                duplicate.output = obj.output.copy()
-
+            duplicate = clone_component(obj)
             duplicate.rect.x = obj.rect.x + offset_x
             duplicate.rect.y = obj.rect.y + offset_y
-            duplicates.append(duplicate)
+            copies[obj] = duplicate
+
+        internal = dict.fromkeys(
+            cable for obj in copies for cable in self.board_index.attached_cables(obj)
+            if cable.output_obj in copies and cable.input_obj in copies)
 
         # Clear selection of the current objects
-        for obj in self.selected_objects:
-            obj.selected = False
+        self.deselect_all()
 
-        self.selected_objects.clear()
+        # Add duplicates and their cables and select them
+        for duplicate in copies.values():
+            self.add_object(duplicate)
+            self.selected_objects[duplicate] = None
+            duplicate.selected = True
 
-        # Add duplicates to their respective lists and select them
-        for duplicate in duplicates:
-            self.draggable_objects.append(duplicate)
-            self.all_sprites.add(duplicate)
-            self.selected_objects.append(duplicate)  # Select the new duplicate
+        for cable in internal:
+            duplicate = connect(copies[cable.output_obj], cable.output_index,
+                                copies[cable.input_obj], cable.input_index)
             duplicate.selected = True
+            self.add_cable(duplicate)
+            self.selected_cables[duplicate] = None
+
+    def package_selected_objects(self):
+        # the selection becomes one custom chip, its switches are the chip's
+        # inputs and its lights its outputs. cables crossing the selection are dropped
+        objects = list(self.selected_objects)
+        index = {obj: i for i, obj in enumerate(objects)}
+        attached = dict.fromkeys(cable for obj in objects
+                                 for cable in self.board_index.attached_cables(obj))
+        try:
+            chip = ChipDefinition(
+                [obj.opcode for obj in objects],
+                [obj.rect.topleft for obj in objects],
+                cable_connections(attached, index),
+                chip_components(objects))
+        except ValueError as error:
+            self.show_alert(str(error), 'error')
+            return
+
+        for cable in attached:
+            self.selected_cables.pop(cable, None)
+        for obj in objects:
+            self.remove_object(obj)
+        self.selected_objects.clear()
+
+        new_object = Chip(chip)
+        new_object.rect.x = min(obj.rect.x for obj in objects)
+        new_object.rect.y = min(obj.rect.y for obj in objects)
+        self.add_object(new_object)
 
     def find_closest_output_snap_point(self, cable_start_pos, snap_threshold=50):
-        closest_point = None
-        min_distance = float('inf')
-        output_obj = None
-
-        for obj in self.draggable_objects:
-            if hasattr(obj, 'output') and obj.output:
-                slot_pos = (
-                    obj.rect.x + obj.output[0][0], obj.rect.y + obj.output[0][1])
-                distance = calculate_distance(cable_start_pos, slot_pos)
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_point = slot_pos
-                    output_obj = obj
-
-        if min_distance <= snap_threshold:
-            return closest_point, output_obj
+        port, slot_pos = self.board_index.closest_port(
+            cable_start_pos, 'output', snap_threshold)
+        if port is not None:
+            return slot_pos, port[0], port[2]
         else:
-            return cable_start_pos, None
+            return cable_start_pos, None, 0
 
     def find_closest_input_snap_point(self, cable_end_pos, snap_threshold=50):
-        closest_point = None
-        min_distance = float('inf')
-        input_obj = None
-        input_index = None  # Index of the input slot
-
-        for obj in self.draggable_objects:
-            if hasattr(obj, 'inputs') and obj.inputs:
-                for idx, input_slot in enumerate(obj.inputs):
-                    slot_pos = (
-                        obj.rect.x + input_slot[0], obj.rect.y + input_slot[1])
-                    distance = calculate_distance(cable_end_pos, slot_pos)
-                    if distance < min_distance:
-                        min_distance = distance
-                        closest_point = slot_pos
-                        input_obj = obj
-                        input_index = idx
-
-        if min_distance <= snap_threshold:
-            return closest_point, input_obj, input_index
+        port, slot_pos = self.board_index.closest_port(
+            cable_end_pos, 'input', snap_threshold)
+        if port is not None:
+            return slot_pos, port[0], port[2]
         else:
             return cable_end_pos, None, None
 
     def handle_cable_creation(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self.mouse_start_pos = event.pos
-            start_pos, output = self.find_closest_output_snap_point(
-                self.mouse_start_pos)
+            start_pos, output, output_index = self.find_closest_output_snap_point(
+                self.mouse_start_pos, snap_threshold=round(50 / self.camera.zoom))
             self.current_cable = Cable(
                 start_pos,
                 end_pos=self.mouse_start_pos,
                 output_obj=output,
-                input_obj=None
+                input_obj=None,
+                output_index=output_index
             )
 
         elif event.type == pygame.MOUSEMOTION and self.mouse_start_pos:
@@ -329,7 +659,7 @@ class Loop:
             self.mouse_start_pos = None
             if self.current_cable:
                 end_pos, input, input_index = self.find_closest_input_snap_point(
-                    self.current_cable.end_pos, snap_threshold=50
+                    self.current_cable.end_pos, snap_threshold=round(50 / self.camera.zoom)
                 )
             if input:
                 self.current_cable.input_obj = input
@@ -338,7 +668,7 @@ class Loop:
                 # Check if both the start and end of the cable have successfully snapped
                 if self.current_cable.input_obj is not None and self.current_cable.output_obj is not None:
                     self.current_cable.end_pos = end_pos
-                    self.cables.append(self.current_cable)
+                    self.add_cable(self.current_cable)
                 else:
                     pass
 
@@ -346,16 +676,122 @@ class Loop:
                 self.current_cable = None
 
     def switch_flip(self, event):
-        for obj in self.draggable_objects:
+        if event.type != pygame.MOUSEBUTTONDOWN or event.button != 3:
+            return
+        for obj in self.board_index.objects_at(event.pos):
             if isinstance(obj, Switch):
                 if obj.is_right_clicked(event):
                     obj.toggle_switch()
+                    self.netlist.set_output(obj, obj.output[0][2])
+                    self.history.record(TOGGLE, obj)
+
+    def save_truth_table(self, path=TRUTH_TABLE_FILE):
+        # every switch combination at once on the bit-parallel simulator
+        if self.topology_changed:
+            self.build_netlist()
+        try:
+            columns, table = truth_table(self.netlist, max_inputs=TRUTH_TABLE_MAX_INPUTS)
+            with open(path, 'w') as file:
+                file.write(format_truth_table(columns, table) + '\n')
+        except (OSError, ValueError) as error:
+            self.show_alert(str(error), 'error')
+            return
+        self.show_alert(f'truth table with {len(table)} rows written to {path}', 'success')
+
+    def save_circuit(self, path=CIRCUIT_FILE):
+        index = {obj: i for i, obj in enumerate(self.draggable_objects)}
+        write_circuit(
+            path,
+            [obj.opcode for obj in self.draggable_objects],
+            [obj.rect.topleft for obj in self.draggable_objects],
+            cable_connections(self.cables, index),
+            [obj.output[0][2] if obj.output_count else 0 for obj in self.draggable_objects],
+            chip_components(self.draggable_objects))
+        self.show_alert(f'saved {len(index)} components to {path}', 'success')
+
+    def load_circuit(self, path=CIRCUIT_FILE):
+        # replaces the board, images are only decoded once something is drawn
+        ops, states, xs, ys, table, chips = read_circuit(path, ChipDefinition)
+        connections = quads(table)
+        check_cables(ops, connections, chips)
+        objects = []
+        for component, (op, state, x, y) in enumerate(zip(ops, states, xs, ys)):
+            if op == OP_CHIP:
+                obj = Chip(chips[component])
+            else:
+                obj = make_component(OPCODE_NAMES[op])
+            obj.rect.topleft = (x, y)
+            if obj.output_count:
+                obj.output[0][2] = state
+            if isinstance(obj, Switch):
+                obj.update_image()
+            objects.append(obj)
+
+        cables = [connect(objects[source], output_index, objects[target], input_index)
+                  for source, output_index, target, input_index in connections]
+        self.set_board(objects, cables)
+
+    def set_board(self, objects, cables):
+        # replaces everything on the board
+        self.draggable_objects = dict.fromkeys(objects)
+        self.cables = dict.fromkeys(cables)
+        self.selected_objects = {}
+        self.selected_cables = {}
+        self.currently_dragged_object = None
+        self.current_cable = None
+        self.history.clear()
+        self.probes = {}
+        self.analyzer.probe((), ())
+        self.board_index = BoardIndex()
+        for obj in objects:
+            self.board_index.add_object(obj)
+        self.cable_layer = CableLayer(self.board_index, self.camera, self.display_surface.get_size())
+        for cable in cables:
+            self.board_index.add_cable(cable)
+            self.cable_layer.add(cable)
+        self.renderer.invalidate()
+        self.topology_changed = True
 
     def handle_events(self, events):
         for event in events:
+            # everything one event changes is undone in one step
+            self.history.commit()
+
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.renderer.invalidate()
+
             # click btn
             self.button_click(event)
 
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+                self.save_truth_table()
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.profiler.toggle()
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                self.toggle_probes()
+
+            self.zoom(event)
+            if self.pan(event):
+                continue
+            event = self.board_event(event)
+
+            if event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL:
+                try:
+                    if event.key == pygame.K_s:
+                        self.save_circuit(self.circuit_path)
+                    elif event.key == pygame.K_o:
+                        self.load_circuit(self.circuit_path)
+                    elif event.key == pygame.K_e:
+                        self.toggle_export()
+                    elif event.key == pygame.K_z and event.mod & pygame.KMOD_SHIFT or event.key == pygame.K_y:
+                        self.redo()
+                    elif event.key == pygame.K_z:
+                        self.undo()
+                except (OSError, ValueError) as error:
+                    self.show_alert(str(error), 'error')
+
             if not self.cable_mode:
                 if not self.cable_click(event):
                     self.drag(event)
@@ -372,5 +808,60 @@ class Loop:
                 self.handle_cable_creation(event)
 
 
-def calculate_distance(point1, point2):
-    return np.linalg.norm(np.array(point1) - np.array(point2))
+# button name -> (class, image, width, height)
+COMPONENT_TYPES = {
+    'AND': (AndGate, 'game/assets/AndGate.png', 42, 70),
+    'OR': (OrGate, 'game/assets/OrGate.png', 42, 70),
+    'NOT': (NotGate, 'game/assets/NotGate.png', 42, 70),
+    'NAND': (NandGate, 'game/assets/NandGate.png', 42, 70),
+    'NOR': (NorGate, 'game/assets/NorGate.png', 42, 70),
+    'XOR': (XorGate, 'game/assets/XorGate.png', 42, 70),
+    'LIGHT': (Light, 'game/assets/LIGHT_OFF.png', 42, 70),
+    'LED': (Led, 'game/assets/LED_BLACK.png', 46, 64),
+    'SWITCH': (Switch, 'game/assets/SWITCH_OFF.png', 42, 70),
+    'COUNTER': (Counter, 'game/assets/Counter/0.png', 98, 96),
+    'BOX': (DraggableObject, 'game/assets/DeafaultBOX.png', 50, 50),
+}
+
+
+def make_component(object_type):
+    cls, image_path, width, height = COMPONENT_TYPES.get(object_type, COMPONENT_TYPES['BOX'])
+    return cls(image_path=image_path, width=width, height=height)
+
+
+def clone_component(obj):
+    # a new component of the same kind with fresh ports, images come from the cache
+    if isinstance(obj, Chip):
+        return Chip(obj.chip)
+    for cls, image_path, width, height in COMPONENT_TYPES.values():
+        if type(obj) is cls:
+            break
+    else:
+        image_path, width, height = obj.image_path, obj.rect.width, obj.rect.height
+    duplicate = type(obj)(image_path=image_path, width=width, height=height)
+    if isinstance(obj, Switch) and obj.output[0][2]:
+        duplicate.toggle_switch()
+    return duplicate
+
+
+def connect(output_obj, output_index, input_obj, input_index):
+    cable = Cable((0, 0), (0, 0), output_obj=output_obj, input_obj=input_obj,
+                  input_index=input_index, output_index=output_index)
+    cable.update()
+    return cable
+
+
+def cable_connections(cables, index):
+    # (output, output index, input, input index) of the cables between indexed objects
+    return [(index[cable.output_obj], cable.output_index, index[cable.input_obj], cable.input_index)
+            for cable in cables
+            if cable.output_obj in index and cable.input_obj in index]
+
+
+def chip_components(objects):
+    return {i: obj.chip for i, obj in enumerate(objects) if obj.opcode == OP_CHIP}
+
+
+def draw_sprite(sprite, surface):
+    surface.blit(sprite.image, sprite.rect)
+
@@ -0,0 +1,403 @@
+from .ports import PORTS
+
+
+# compiled netlist: components get integer ids, every output port owns a net,
+# and gate types are mapped to opcodes so the simulation never has to touch
+# the component objects
+
+OP_NONE = 0
+OP_AND = 1
+OP_OR = 2
+OP_NOT = 3
+OP_NAND = 4
+OP_NOR = 5
+OP_XOR = 6
+OP_SWITCH = 7
+OP_LIGHT = 8
+OP_LED = 9
+OP_COUNTER = 10
+OP_CHIP = 11
+
+# component names as used by the buttons
+OPCODES = {
+    'AND': OP_AND,
+    'OR': OP_OR,
+    'NOT': OP_NOT,
+    'NAND': OP_NAND,
+    'NOR': OP_NOR,
+    'XOR': OP_XOR,
+    'SWITCH': OP_SWITCH,
+    'LIGHT': OP_LIGHT,
+    'LED': OP_LED,
+    'COUNTER': OP_COUNTER,
+    'BOX': OP_NONE,
+    'CHIP': OP_CHIP,
+}
+OPCODE_NAMES = {op: name for name, op in OPCODES.items()}
+
+INPUT_COUNTS = {
+    OP_NONE: 0,
+    OP_AND: 2,
+    OP_OR: 2,
+    OP_NOT: 1,
+    OP_NAND: 2,
+    OP_NOR: 2,
+    OP_XOR: 2,
+    OP_SWITCH: 0,
+    OP_LIGHT: 1,
+    OP_LED: 3,
+    OP_COUNTER: 5,
+}
+
+OUTPUT_COUNTS = {
+    OP_AND: 1,
+    OP_OR: 1,
+    OP_NOT: 1,
+    OP_NAND: 1,
+    OP_NOR: 1,
+    OP_XOR: 1,
+    OP_SWITCH: 1,
+}
+
+GATE_OPS = (OP_AND, OP_OR, OP_NOT, OP_NAND, OP_NOR, OP_XOR)
+SINK_OPS = (OP_LIGHT, OP_LED, OP_COUNTER)
+
+# truth tables indexed by (a << 1) | b, NOT ignores b
+TRUTH_TABLES = {
+    OP_AND: (0, 0, 0, 1),
+    OP_OR: (0, 1, 1, 1),
+    OP_NOT: (1, 1, 0, 0),
+    OP_NAND: (1, 1, 1, 0),
+    OP_NOR: (1, 0, 0, 0),
+    OP_XOR: (0, 1, 1, 0),
+}
+TABLE_OPS = {table: op for op, table in TRUTH_TABLES.items()}
+
+# led colour for (yellow, blue, red) inputs, most specific combination first
+LED_COLORS = (
+    ((1, 1, 1), 'WHITE'),
+    ((1, 1, 0), 'GREEN'),
+    ((0, 1, 1), 'PURPLE'),
+    ((1, 0, 1), 'ORANGE'),
+    ((0, 0, 1), 'RED'),
+    ((0, 1, 0), 'BLUE'),
+    ((1, 0, 0), 'YELLOW'),
+)
+
+
+def led_color(inputs):
+    for mask, color in LED_COLORS:
+        if all(bit for bit, wanted in zip(inputs, mask) if wanted):
+            return color
+    return 'BLACK'
+
+
+def counter_value(inputs):
+    # input k represents 2 ** k
+    return sum(1 << k for k, bit in enumerate(inputs) if bit)
+
+
+def sink_state(op, inputs):
+    if op == OP_LIGHT:
+        return int(bool(inputs[0]))
+    if op == OP_LED:
+        return led_color(inputs)
+    return counter_value(inputs)
+
+
+def port_counts(op, chip=None):
+    # (inputs, outputs) of a component, a chip's come from its definition
+    if op == OP_CHIP:
+        return chip.input_count, chip.output_count
+    return INPUT_COUNTS[op], OUTPUT_COUNTS.get(op, 0)
+
+
+class ChipCall:
+    # a chip instance in the program, evaluated as a whole instead of per gate
+    __slots__ = ('chip', 'inputs', 'outputs')
+
+    def __init__(self, chip, inputs, outputs):
+        self.chip = chip
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def evaluate(self, values):
+        pattern = 0
+        for k, net in enumerate(self.inputs):
+            pattern |= values[net] << k
+        result = self.chip.evaluate(pattern)
+        return [(out, result >> j & 1) for j, out in enumerate(self.outputs)]
+
+
+def entry_nets(entry):
+    # (input nets, output nets) of a gate or chip in the program
+    if entry.__class__ is ChipCall:
+        return entry.inputs, entry.outputs
+    table, a, b, out = entry
+    return (a, b), (out,)
+
+
+# net 0 is a constant low that every unconnected input points at
+NET_LOW = 0
+
+
+class Netlist:
+    # only the levelized netlist can rewrite its program, see optimizer.py
+    optimize = False
+
+    def __init__(self):
+        self.objects = []
+        self.index = {}
+
+        # per component, chips also map to their definition
+        self.ops = []
+        self.chips = {}
+        self.input_start = [0]
+        self.output_start = [0]
+
+        # per input port / per net
+        self.input_nets = []
+        self.values = bytearray(1)
+        self.net_ports = [[]]
+        self.net_cables = [[]]
+        self.net_driver = [None]
+
+        # (truth table, a net, b net, out net) for every gate, a ChipCall per chip
+        self.program = []
+        self.program_owner = []
+        self.sinks = []
+
+        # net -> gates reading it, and the gates to evaluate next tick
+        self.fanout = [[]]
+        self.pending = set()
+
+        # gates evaluated so far, for the profiler
+        self.evaluated = 0
+
+        # cables whose state was written since the editor last redrew them
+        self.redraw_cables = set()
+
+        # nets of feedback loops that failed to settle
+        self.oscillating = set()
+
+        # nets the optimizer folded away, net -> the net it copies and
+        # net -> its constant value
+        self.aliases = {}
+        self.constants = {}
+
+    def build(self, objects, cables, observed=()):
+        # compile the board into flat arrays, called only when the topology
+        # changes. observed are (object, output index) pairs that have to stay
+        # exact besides the outputs with cables
+        previous_sources = self.input_sources()
+        previous_pending = {self.objects[self.program_owner[g]] for g in self.pending}
+        index = {obj: i for i, obj in enumerate(objects)}
+        ops = [obj.opcode for obj in objects]
+        chips = {i: obj.chip for i, obj in enumerate(objects) if obj.opcode == OP_CHIP}
+
+        # cables left dangling by a delete are simply not part of the netlist
+        connected = [cable for cable in cables
+                     if cable.output_obj in index and cable.input_obj in index]
+        connections = [(index[cable.output_obj], cable.output_index,
+                        index[cable.input_obj], cable.input_index)
+                       for cable in connected]
+
+        values = []
+        for obj in objects:
+            for port in getattr(obj, 'output', ()):
+                values.append(port[2])
+
+        observed = [(source, output_index) for source, output_index, _, _ in connections] + \
+                   [(index[obj], output_index) for obj, output_index in observed if obj in index]
+        self.compile(ops, connections, values, chips, observed)
+        self.objects = list(objects)
+        self.index = index
+
+        for cable, (source, output_index, _, _) in zip(connected, connections):
+            self.net_cables[self.output_start[source] + output_index].append(cable)
+
+        # only gates that are new, rewired or were still settling need evaluating.
+        # an optimized program can fold away gates whose value changed, so it
+        # starts over
+        sources = self.input_sources()
+        self.pending = set(range(len(self.program))) if self.optimize else {
+            g for g, component in enumerate(self.program_owner)
+            if self.objects[component] in previous_pending
+            or previous_sources.get(self.objects[component]) != sources[self.objects[component]]
+        }
+
+        self.sync(range(len(self.values)))
+
+    def compile(self, ops, connections, values=None, chips=None, observed=None, constants=()):
+        # connections are (source component, output index, target component, input index),
+        # chips maps every chip component to its definition. observed and
+        # constants are (component, output index) pairs, only the optimizer uses them
+        self.objects = []
+        self.index = {}
+        self.ops = list(ops)
+        self.chips = dict(chips or {})
+
+        self.input_start = [0]
+        self.output_start = []
+        net = 1
+        for component, op in enumerate(self.ops):
+            inputs, outputs = port_counts(op, self.chips.get(component))
+            self.input_start.append(self.input_start[-1] + inputs)
+            self.output_start.append(net)
+            net += outputs
+        self.output_start.append(net)
+
+        self.input_nets = [NET_LOW] * self.input_start[-1]
+        self.values = bytearray(net)
+        if values:
+            self.values[1:] = bytes(1 if v else 0 for v in values)
+
+        self.net_driver = [None] * net
+        for component in range(len(self.ops)):
+            start = self.output_start[component]
+            for k in range(self.output_start[component + 1] - start):
+                self.net_driver[start + k] = (component, k)
+
+        # a later cable into the same input wins, like it did on the sprites
+        for source, output_index, target, input_index in connections:
+            self.input_nets[self.input_start[target] + input_index] = \
+                self.output_start[source] + output_index
+
+        self.net_ports = [[] for _ in range(net)]
+        self.net_cables = [[] for _ in range(net)]
+        for component in range(len(self.ops)):
+            start = self.input_start[component]
+            for k in range(self.input_start[component + 1] - start):
+                self.net_ports[self.input_nets[start + k]].append((component, k))
+
+        self.program = []
+        self.program_owner = []
+        self.sinks = []
+        for component, op in enumerate(self.ops):
+            start = self.input_start[component]
+            if op in GATE_OPS:
+                a = self.input_nets[start]
+                b = self.input_nets[start + 1] if op != OP_NOT else NET_LOW
+                self.program.append(
+                    (TRUTH_TABLES[op], a, b, self.output_start[component]))
+                self.program_owner.append(component)
+            elif op == OP_CHIP:
+                inputs = tuple(self.input_nets[start:self.input_start[component + 1]])
+                outputs = tuple(range(self.output_start[component], self.output_start[component + 1]))
+                self.program.append(ChipCall(self.chips[component], inputs, outputs))
+                self.program_owner.append(component)
+            elif op in SINK_OPS:
+                self.sinks.append(component)
+
+        self.aliases = {}
+        self.constants = {}
+        self.index_program()
+
+    def index_program(self):
+        # net -> gates reading it, and every gate pending
+        self.fanout = [[] for _ in range(len(self.values))]
+        for g, entry in enumerate(self.program):
+            if entry.__class__ is ChipCall:
+                inputs = set(entry.inputs)
+            else:
+                table, a, b, out = entry
+                inputs = {a} if table is TRUTH_TABLES[OP_NOT] else {a, b}
+            for net in inputs:
+                self.fanout[net].append(g)
+        self.pending = set(range(len(self.program)))
+
+    def step(self):
+        # one synchronous tick over the gates whose inputs changed last tick,
+        # an idle circuit has nothing pending and costs nothing
+        if not self.pending:
+            return []
+        values = self.values
+        program = self.program
+        self.evaluated += len(self.pending)
+        updates = []
+        for g in self.pending:
+            entry = program[g]
+            if entry.__class__ is ChipCall:
+                updates.extend((out, value) for out, value in entry.evaluate(values)
+                               if value != values[out])
+                continue
+            table, a, b, out = entry
+            value = table[values[a] << 1 | values[b]]
+            if value != values[out]:
+                updates.append((out, value))
+
+        fanout = self.fanout
+        pending = set()
+        changed = []
+        for out, value in updates:
+            values[out] = value
+            changed.append(out)
+            pending.update(fanout[out])
+        self.pending = pending
+        self.sync(changed)
+        return changed
+
+    def settled(self):
+        return not self.pending
+
+    def set_output(self, obj, value, output_index=0):
+        component = self.index.get(obj)
+        if component is not None:
+            self.set_component_output(component, value, output_index)
+
+    def set_component_output(self, component, value, output_index=0):
+        net = self.output_start[component] + output_index
+        value = 1 if value else 0
+        if self.values[net] == value:
+            return
+        self.values[net] = value
+        self.pending.update(self.fanout[net])
+        self.sync((net,))
+
+    def oscillating_components(self):
+        # components driving a net of a feedback loop that does not settle
+        return sorted({self.net_driver[net][0] for net in self.oscillating})
+
+    def sink_states(self):
+        return {sink: sink_state(self.ops[sink], self.input_values(sink)) for sink in self.sinks}
+
+    def input_sources(self):
+        # what drives every input of every component, used to spot rewired gates
+        sources = {}
+        for component, obj in enumerate(self.objects):
+            start = self.input_start[component]
+            end = self.input_start[component + 1]
+            # the output index matters, a cable can move between outputs of a chip
+            sources[obj] = tuple(self.net_driver[net] and
+                                 (self.objects[self.net_driver[net][0]], self.net_driver[net][1])
+                                 for net in self.input_nets[start:end])
+        return sources
+
+    def input_values(self, component):
+        start = self.input_start[component]
+        end = self.input_start[component + 1]
+        return [self.values[net] for net in self.input_nets[start:end]]
+
+    def sync(self, nets):
+        # write changed nets back to the components so they can be drawn
+        if not self.objects:
+            return
+        states = PORTS.state
+        objects = self.objects
+        touched_sinks = set()
+        for net in nets:
+            state = self.values[net]
+            driver = self.net_driver[net]
+            if driver is not None:
+                obj = objects[driver[0]]
+                states[obj.port_base + obj.input_count + driver[1]] = state
+            cables = self.net_cables[net]
+            for cable in cables:
+                cable.active = state == 1
+            self.redraw_cables.update(cables)
+            for component, input_index in self.net_ports[net]:
+                states[objects[component].port_base + input_index] = state
+                if self.ops[component] in SINK_OPS:
+                    touched_sinks.add(component)
+        for component in touched_sinks:
+            objects[component].update_state()
@@ -0,0 +1,111 @@
+from .netlist import *
+
+
+# optional rewrite of the gate program before the levelized simulator runs
+# it, the board keeps every component. values only have to stay exact on
+# observed nets: sink inputs, outputs with cables and probes. gates outside
+# feedback loops are folded in topological order
+#   constants   a gate whose output is fixed by constant inputs is dropped,
+#               its net keeps the constant
+#   copies      AND with 1, OR and XOR with 0, x AND x ... copy one input,
+#               NAND with 1, NOR with 0 ... become a NOT of it
+#   NOT-NOT     a NOT of a NOT copies the inner input
+#   duplicates  a gate with the type and inputs of an earlier gate copies it
+#   dead gates  gates nothing reads or observes are dropped
+# gates reading a copied net read its source instead, copied nets that are
+# observed follow their source after every tick. in zero-delay levelized
+# mode this changes no observed value, feedback loops are only rewired
+
+CONSTANT, COPY, INVERT = range(3)
+
+
+def reduce_gate(table, a, b, known):
+    # (CONSTANT, value), (COPY, net), (INVERT, net) or None for a gate,
+    # known maps constant nets to their value
+    pairs = [(x, y)
+             for x in ((known[a],) if a in known else (0, 1))
+             for y in ((known[b],) if b in known else (0, 1))
+             if a != b or x == y]
+    outputs = [table[x << 1 | y] for x, y in pairs]
+    if len(set(outputs)) == 1:
+        return CONSTANT, outputs[0]
+    for k, net in enumerate((a, b)):
+        if all(out == pair[k] for out, pair in zip(outputs, pairs)):
+            return COPY, net
+        if all(out != pair[k] for out, pair in zip(outputs, pairs)):
+            return INVERT, net
+    return None
+
+
+def optimize(netlist, components, observed=(), constants=()):
+    # rewrites the program of a compiled netlist. components are its strongly
+    # connected components in topological order, observed and constants are
+    # nets. returns the number of gates removed
+    program = netlist.program
+    looped = set()
+    for component in components:
+        inputs, outputs = entry_nets(program[component[0]])
+        if len(component) > 1 or set(inputs) & set(outputs):
+            looped.update(component)
+
+    known = {net: netlist.values[net] for net in constants}
+    known[NET_LOW] = 0
+    aliases = {}
+    inverted = {}
+    seen = {}
+    kept = {}
+    for component in components:
+        for g in component:
+            entry = program[g]
+            if entry.__class__ is ChipCall:
+                kept[g] = ChipCall(entry.chip, tuple(aliases.get(net, net) for net in entry.inputs),
+                                   entry.outputs)
+                continue
+            table, a, b, out = entry
+            a, b = aliases.get(a, a), aliases.get(b, b)
+            if g in looped:
+                kept[g] = (table, a, b, out)
+                continue
+
+            reduced = reduce_gate(table, a, b, known)
+            if reduced and reduced[0] == CONSTANT:
+                known[out] = netlist.values[out] = reduced[1]
+                continue
+            if reduced and reduced[0] == COPY:
+                aliases[out] = reduced[1]
+                continue
+            if reduced:
+                if reduced[1] in inverted:
+                    aliases[out] = inverted[reduced[1]]
+                    continue
+                table, a, b = TRUTH_TABLES[OP_NOT], reduced[1], NET_LOW
+                inverted[out] = a
+
+            # every two input gate is symmetric
+            key = (table, min(a, b), max(a, b))
+            if key in seen:
+                aliases[out] = seen[key]
+                continue
+            seen[key] = out
+            kept[g] = (table, a, b, out)
+
+    observed = set(observed)
+    for sink in netlist.sinks:
+        observed.update(netlist.input_nets[netlist.input_start[sink]:netlist.input_start[sink + 1]])
+    live = observed | {aliases[net] for net in observed if net in aliases}
+    for g in reversed([g for component in components for g in component]):
+        if g not in kept:
+            continue
+        inputs, outputs = entry_nets(kept[g])
+        if g in looped or not live.isdisjoint(outputs):
+            live.update(inputs)
+        else:
+            del kept[g]
+
+    gates = sorted(kept)
+    netlist.program = [kept[g] for g in gates]
+    netlist.program_owner = [netlist.program_owner[g] for g in gates]
+    netlist.aliases = {net: source for net, source in aliases.items() if net in observed}
+    netlist.constants = {net: value for net, value in known.items() if net != NET_LOW}
+    netlist.index_program()
+    return len(program) - len(gates)
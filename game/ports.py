@@ -0,0 +1,103 @@
+from array import array
+
+
+# struct-of-arrays table holding the ports of every component: slot offsets
+# relative to the component and the current state. a component owns one
+# contiguous block, inputs first then outputs, and only keeps the block start
+
+class PortTable:
+    def __init__(self):
+        self.x = array('h')
+        self.y = array('h')
+        self.state = bytearray()
+        # block size -> starts of released blocks ready for reuse
+        self.free = {}
+
+    def __len__(self):
+        return len(self.state)
+
+    def allocate(self, offsets):
+        count = len(offsets)
+        blocks = self.free.get(count)
+        if blocks:
+            base = blocks.pop()
+        else:
+            base = len(self.state)
+            self.x.extend([0] * count)
+            self.y.extend([0] * count)
+            self.state.extend(bytes(count))
+        for k, (x, y) in enumerate(offsets):
+            self.x[base + k] = x
+            self.y[base + k] = y
+            self.state[base + k] = 0
+        return base
+
+    def release(self, base, count):
+        if count:
+            self.free.setdefault(count, []).append(base)
+
+
+PORTS = PortTable()
+
+
+class Port:
+    # view of one row, indexes like the old [x, y, state] lists
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, field):
+        if field == 2:
+            return self.table.state[self.index] == 1
+        if field == 0:
+            return self.table.x[self.index]
+        if field == 1:
+            return self.table.y[self.index]
+        raise IndexError(field)
+
+    def __setitem__(self, field, value):
+        if field == 2:
+            self.table.state[self.index] = 1 if value else 0
+        elif field == 0:
+            self.table.x[self.index] = value
+        elif field == 1:
+            self.table.y[self.index] = value
+        else:
+            raise IndexError(field)
+
+    def __iter__(self):
+        return iter((self[0], self[1], self[2]))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class PortList:
+    # view of a run of rows, what used to be a component's inputs or output list
+    __slots__ = ('table', 'start', 'count')
+
+    def __init__(self, table, start, count):
+        self.table = table
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return Port(self.table, self.start + i)
+
+    def __iter__(self):
+        return (Port(self.table, self.start + i) for i in range(self.count))
+
+    def __repr__(self):
+        return repr([list(port) for port in self])
+
+    def states(self):
+        return [state == 1 for state in self.table.state[self.start:self.start + self.count]]
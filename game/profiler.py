@@ -0,0 +1,114 @@
+import csv
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+import pygame
+from .settings import *
+from . import image_cache
+
+
+# optional per-frame instrumentation of the main loop. every frame records
+# the ms spent in each phase plus a few counters, the last PROFILER_WINDOW
+# frames are averaged for the overlay and every frame can be streamed to a
+# csv or json lines file
+
+PHASES = ('events', 'simulate', 'cables', 'render', 'display')
+COUNTERS = ('gates', 'cables_drawn', 'images_loaded', 'images_scaled')
+FIELDS = ('frame_ms',) + tuple(f'{phase}_ms' for phase in PHASES) + COUNTERS
+
+
+class FrameProfiler:
+    def __init__(self, enabled=PROFILER_ENABLED, path=None, window=PROFILER_WINDOW):
+        self.enabled = enabled
+        self.frames = deque(maxlen=window)
+        self.frame = dict.fromkeys(FIELDS, 0)
+        self.frame_start = time.perf_counter()
+        self.image_stats = dict(image_cache.stats)
+        self.file = None
+        self.writer = None
+        if path:
+            self.export(path)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frames.clear()
+
+    @property
+    def recording(self):
+        return self.enabled or self.file is not None
+
+    def export(self, path):
+        # stream every frame to path, csv if it ends in .csv, json lines otherwise
+        self.file = open(path, 'w', newline='')
+        if path.endswith('.csv'):
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            self.writer.writeheader()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.writer = None
+
+    @contextmanager
+    def phase(self, name):
+        if not self.recording:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.frame[f'{name}_ms'] += (time.perf_counter() - start) * 1000
+
+    def count(self, name, amount=1):
+        self.frame[name] += amount
+
+    def end_frame(self):
+        now = time.perf_counter()
+        frame = self.frame
+        frame['frame_ms'] = (now - self.frame_start) * 1000
+        self.frame_start = now
+        stats = image_cache.stats
+        frame['images_loaded'] = stats['loads'] - self.image_stats['loads']
+        frame['images_scaled'] = stats['scales'] - self.image_stats['scales']
+        self.image_stats = dict(stats)
+        self.frame = dict.fromkeys(FIELDS, 0)
+        if not self.recording:
+            return
+
+        self.frames.append(frame)
+        if self.writer:
+            self.writer.writerow({name: round(value, 3) for name, value in frame.items()})
+        elif self.file:
+            self.file.write(json.dumps({name: round(value, 3) for name, value in frame.items()}) + '\n')
+
+    def averages(self):
+        count = len(self.frames) or 1
+        return {name: sum(frame[name] for frame in self.frames) / count for name in FIELDS}
+
+
+class ProfilerOverlay:
+    # rolling averages drawn in a box like the alerts
+    def __init__(self, profiler, position=(WIDTH - 10, 60)):
+        self.profiler = profiler
+        self.position = position
+        self.font = pygame.font.Font(None, 20)
+        self.background_color = WHITE
+        self.text_color = BLACK
+        self.line_height = self.font.get_linesize()
+        width = max(self.font.size(f'{name:<14}0000.00')[0] for name in FIELDS)
+        self.rect = pygame.Rect(0, 0, width + 20, self.line_height * len(FIELDS) + 10)
+        self.rect.topright = position
+
+    def lines(self):
+        averages = self.profiler.averages()
+        return tuple(f'{name:<14}{averages[name]:.2f}' if name.endswith('_ms')
+                     else f'{name:<14}{averages[name]:.1f}' for name in FIELDS)
+
+    def draw(self, surface):
+        pygame.draw.rect(surface, self.background_color, self.rect)
+        for k, line in enumerate(self.lines()):
+            image = self.font.render(line, True, self.text_color)
+            surface.blit(image, (self.rect.x + 10, self.rect.y + 5 + k * self.line_height))
@@ -0,0 +1,133 @@
+import pygame
+from .settings import *
+
+
+# repaints only the parts of the screen whose content changed since the last
+# frame. every drawable is handed in as (key, rect, version, draw) in drawing
+# order, an item is dirty when its rect or version differs from last frame
+
+class Renderer:
+    def __init__(self, surface):
+        self.surface = surface
+        self.items = {}
+        self.full_redraw = True
+        self.last_dirty = []
+        # strips uncovered by scrolling since the last frame
+        self.scrolled = []
+        # draw function -> number of items it drew last frame
+        self.draw_counts = {}
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def scroll(self, dx, dy, keep=()):
+        # everything on the board moved by dx, dy. the picture is shifted
+        # instead of redrawn and only the uncovered strips are painted. items
+        # that did not move along, like the buttons, no longer match their
+        # shifted rect and are repainted. items in keep stay where they are,
+        # they scroll their own content
+        screen_rect = self.surface.get_rect()
+        if self.full_redraw or abs(dx) >= screen_rect.width or abs(dy) >= screen_rect.height:
+            self.full_redraw = True
+            return
+        self.surface.set_clip(None)
+        self.surface.scroll(dx, dy)
+        self.items = {key: (rect if key in keep else rect.move(dx, dy), version)
+                      for key, (rect, version) in self.items.items()}
+        self.scrolled = [rect.move(dx, dy) for rect in self.scrolled]
+        self.scrolled += exposed_strips(screen_rect, dx, dy)
+
+    def render(self, items, dirty=()):
+        # dirty holds extra areas to repaint, for items that track their own changes
+        self.draw_counts = {}
+        dirty = list(dirty)
+        strips = self.scrolled
+        self.scrolled = []
+        previous = self.items
+        current = {}
+        for key, rect, version, draw in items:
+            old = previous.get(key)
+            if old is None:
+                dirty.append(rect)
+            elif old[0] != rect or old[1] != version:
+                dirty.append(old[0])
+                dirty.append(rect)
+            current[key] = (rect, version)
+        # items that disappeared leave a hole behind
+        for key, (rect, version) in previous.items():
+            if key not in current:
+                dirty.append(rect)
+        self.items = current
+
+        # off screen changes need no repaint, nor does whatever lies within a
+        # strip uncovered by scrolling, it is painted with the strip
+        screen_rect = self.surface.get_rect()
+        dirty = [rect for rect in dirty if rect.colliderect(screen_rect)
+                 and not any(strip.contains(rect.clip(screen_rect)) for strip in strips)]
+        if self.full_redraw or len(dirty) > RENDER_MAX_DIRTY_RECTS:
+            self.full_redraw = False
+            self.surface.set_clip(None)
+            self.surface.fill(BACKGROUND_COLOR)
+            for key, rect, version, draw in items:
+                draw(key, self.surface)
+                self.draw_counts[draw] = self.draw_counts.get(draw, 0) + 1
+            self.last_dirty = [screen_rect]
+            return self.last_dirty
+
+        # strips are kept apart, merged with the toolbar they would cover
+        # most of the screen. painting a pixel twice is only slower
+        dirty = merge_rects(rect.clip(screen_rect) for rect in dirty) + strips
+        if not dirty:
+            self.last_dirty = []
+            return self.last_dirty
+
+        rects = [item[1] for item in items]
+        for area in dirty:
+            self.surface.set_clip(area)
+            self.surface.fill(BACKGROUND_COLOR)
+            for i in area.collidelistall(rects):
+                key, rect, version, draw = items[i]
+                draw(key, self.surface)
+                self.draw_counts[draw] = self.draw_counts.get(draw, 0) + 1
+        self.surface.set_clip(None)
+        # after a scroll the whole picture moved, so all of it goes to the display
+        self.last_dirty = [screen_rect] if strips else dirty
+        return self.last_dirty
+
+
+def merge_rects(rects):
+    # fold overlapping rects together so every pixel is repainted once
+    merged = []
+    for rect in rects:
+        if rect.width == 0 or rect.height == 0:
+            continue
+        rect = rect.copy()
+        hit = rect.collidelist(merged)
+        while hit != -1:
+            rect.union_ip(merged.pop(hit))
+            hit = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+def line_rect(start_pos, end_pos, width):
+    left = min(start_pos[0], end_pos[0])
+    top = min(start_pos[1], end_pos[1])
+    rect = pygame.Rect(left, top,
+                       abs(end_pos[0] - start_pos[0]) + 1,
+                       abs(end_pos[1] - start_pos[1]) + 1)
+    return rect.inflate(width * 2, width * 2)
+
+
+def exposed_strips(rect, dx, dy):
+    # the parts of rect uncovered when its content is shifted by dx, dy
+    strips = []
+    if dx > 0:
+        strips.append(pygame.Rect(rect.left, rect.top, dx, rect.height))
+    elif dx < 0:
+        strips.append(pygame.Rect(rect.right + dx, rect.top, -dx, rect.height))
+    if dy > 0:
+        strips.append(pygame.Rect(rect.left, rect.top, rect.width, dy))
+    elif dy < 0:
+        strips.append(pygame.Rect(rect.left, rect.bottom + dy, rect.width, -dy))
+    return strips
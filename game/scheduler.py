@@ -0,0 +1,32 @@
+from .settings import *
+
+
+# fixed-rate simulation clock. elapsed frame time is turned into a whole
+# number of ticks, so the simulation runs at the same speed whatever the frame
+# rate: a slow frame is made up with several ticks, a fast one may get none.
+# ticks a frame had no time for are handed back and run in the next frames
+
+class TickScheduler:
+    def __init__(self, rate=SIMULATION_TICK_RATE, max_backlog=MAX_TICK_BACKLOG):
+        self.rate = rate
+        self.max_backlog = max_backlog
+        self.backlog = 0.0
+
+    def advance(self, dt):
+        # a board that stays too heavy for the tick rate slows down past
+        # max_backlog instead of catching up for ever
+        self.backlog = min(self.backlog + dt * self.rate, self.max_backlog)
+        ticks = int(self.backlog)
+        self.backlog -= ticks
+        return ticks
+
+    def wake(self):
+        # after an idle sleep, the input that woke the loop gets a tick in
+        # the very next frame
+        self.backlog = max(self.backlog, 1.0)
+
+    def defer(self, ticks):
+        self.backlog += ticks
+
+    def behind(self):
+        return self.backlog >= 1
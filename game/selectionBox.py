@@ -27,13 +27,14 @@ class SelectionBox:
             self.rect.y = self.start_y
             self.rect.height = new_height
 
-    def draw(self, surface):
+    def draw(self, surface, rect):
+        # rect is where the box is on screen, self.rect is on the board
         if self.visible:
             temp_surface = pygame.Surface(
-                (self.rect.width, self.rect.height), pygame.SRCALPHA)
+                (rect.width, rect.height), pygame.SRCALPHA)
             temp_surface.fill(self.color)
 
-            surface.blit(temp_surface, (self.rect.x, self.rect.y))
+            surface.blit(temp_surface, (rect.x, rect.y))
 
             pygame.draw.rect(
-                surface, SELECTION_BOX_OUTLINE_COLOR, self.rect, 1)
+                surface, SELECTION_BOX_OUTLINE_COLOR, rect, 1)
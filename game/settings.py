@@ -1,6 +1,6 @@
 # colors
 WHITE = (255, 255, 255)
-BLACK = (0.0, 0)
+BLACK = (0, 0, 0)
 
 BACKGROUND_COLOR = (200, 200, 200,)
 BUTTON_COLOR = (64, 64, 64)
@@ -9,6 +9,8 @@ BUTTON_TEXT_COLOR = (255, 255, 255)
 WIRE_COLOR = (64, 64, 64)
 WIRE_COLOR_ACTIVE = (102, 255, 102)
 WIRE_COLOR_SELECTED = (160, 0, 200)
+# transparent background of the cached cable layer, no wire is drawn in it
+CABLE_LAYER_COLORKEY = (255, 0, 255)
 
 SELECTION_BOX_COLOR = (160, 0, 200, 10)
 SELECTION_BOX_OUTLINE_COLOR = (160, 0, 200)
@@ -18,3 +20,74 @@ ALERT_ERROR_COLOR = (255, 140, 97)
 
 # screen
 WIDTH, HEIGHT = 1700, 1000
+
+# simulation
+# 'levelized' settles combinational logic and latches every tick, 'event' moves one gate per tick,
+# 'compiled' gives the levelized results from a generated python function
+SIMULATION_MODE = 'levelized'
+# fold constants, copies, double inverters and duplicate gates out of the
+# levelized program, see optimizer.py
+NETLIST_OPTIMIZE = False
+# generated tick functions kept compiled, one per topology
+COMPILED_CACHE_SIZE = 8
+
+# maximum number of scaled image variants kept in the image cache
+IMAGE_CACHE_SIZE = 256
+
+# above this many dirty rects a frame is simply redrawn in full
+RENDER_MAX_DIRTY_RECTS = 64
+
+# zoom steps of the mouse wheel. below LOD_SLOT_ZOOM ports are not drawn,
+# below LOD_IMAGE_ZOOM components are drawn as plain boxes and cables 1px wide
+ZOOM_LEVELS = (0.125, 0.25, 0.5, 0.75, 1, 1.5, 2)
+LOD_SLOT_ZOOM = 0.5
+LOD_IMAGE_ZOOM = 0.25
+LOD_COMPONENT_COLOR = (120, 120, 120)
+
+# cell size of the grid index used for hit-testing
+SPATIAL_CELL_SIZE = 128
+
+# circuit file saved with ctrl+s and opened with ctrl+o
+CIRCUIT_FILE = 'circuit.lgsc'
+
+# custom chips with at most this many inputs are compiled to a lookup table
+CHIP_LUT_MAX_INPUTS = 12
+
+# simulation ticks per second, independent of the frame rate
+SIMULATION_TICK_RATE = 60
+
+# seconds spent simulating between two frames. ticks that do not fit are
+# carried over, up to MAX_TICK_BACKLOG of them, and while the simulation is
+# behind the display is only drawn MIN_FPS times per second
+SIMULATION_TIME_BUDGET = 0.03
+MAX_TICK_BACKLOG = 600
+MIN_FPS = 10
+
+# frames drawn per second at most, 0 for no cap
+MAX_FPS = 60
+
+# frame profiler, toggled with F3, averaged over the last PROFILER_WINDOW frames
+PROFILER_ENABLED = False
+PROFILER_WINDOW = 120
+
+# undo steps kept, the oldest are dropped first
+HISTORY_LIMIT = 200
+
+# logic analyzer, ticks kept for the waveform panel, most probes at once
+# and ticks handed to the vcd writer thread per block
+ANALYZER_DEPTH = 1 << 16
+ANALYZER_MAX_PROBES = 32
+ANALYZER_BLOCK = 4096
+# blocks waiting to be written before new ones are dropped
+VCD_QUEUE_BLOCKS = 64
+# one simulation tick per vcd time unit
+VCD_TIMESCALE = '1 ns'
+VCD_FILE = 'waveform.vcd'
+
+# the truth table of the board is written here when T is pressed, over at
+# most this many switches so the editor does not stall on it
+TRUTH_TABLE_FILE = 'truth_table.txt'
+TRUTH_TABLE_MAX_INPUTS = 12
+WAVEFORM_ROW_HEIGHT = 18
+WAVEFORM_TICK_WIDTH = 2
+WAVEFORM_COLOR = (0, 140, 0)
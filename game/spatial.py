@@ -0,0 +1,184 @@
+import math
+from .settings import *
+from .cable import CableSegments
+from .ports import PORTS
+
+
+# uniform grid over the board, every item is filed under the cells its
+# bounding rect touches so lookups only look at what is nearby
+
+class SpatialGrid:
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.item_cells = {}
+
+    def __len__(self):
+        return len(self.item_cells)
+
+    def __contains__(self, item):
+        return item in self.item_cells
+
+    def cell_range(self, rect):
+        size = self.cell_size
+        x0, y0 = rect[0] // size, rect[1] // size
+        x1, y1 = (rect[0] + max(rect[2], 1) - 1) // size, (rect[1] + max(rect[3], 1) - 1) // size
+        return x0, y0, x1, y1
+
+    def insert(self, item, rect):
+        cell_range = self.cell_range(rect)
+        x0, y0, x1, y1 = cell_range
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                self.cells.setdefault((x, y), set()).add(item)
+        self.item_cells[item] = cell_range
+
+    def remove(self, item):
+        cell_range = self.item_cells.pop(item, None)
+        if cell_range is None:
+            return
+        x0, y0, x1, y1 = cell_range
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cell = self.cells[(x, y)]
+                cell.discard(item)
+                if not cell:
+                    del self.cells[(x, y)]
+
+    def move(self, item, rect):
+        # nothing to do while the item stays inside the same cells
+        if self.item_cells.get(item) == self.cell_range(rect):
+            return
+        self.remove(item)
+        self.insert(item, rect)
+
+    def query(self, rect):
+        x0, y0, x1, y1 = self.cell_range(rect)
+        found = set()
+        cells = self.cells
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cell = cells.get((x, y))
+                if cell:
+                    found.update(cell)
+        return found
+
+    def query_point(self, pos, radius=0):
+        return self.query((pos[0] - radius, pos[1] - radius, radius * 2 + 1, radius * 2 + 1))
+
+
+class BoardIndex:
+    # objects by rect and ports by position, ports are filed under their row
+    # in the PORTS table. cables stay out of the grid, where a long one would
+    # fill a whole rectangle of cells, and are tested in one vectorized pass.
+    # it also knows which cables are attached to every object and which cable
+    # drives every input, so moves and deletes only touch the cables of the
+    # objects involved
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.objects = SpatialGrid(cell_size)
+        self.ports = SpatialGrid(cell_size)
+        self.cable_segments = CableSegments()
+        self.port_owner = {}
+        # object -> cables attached to it, in connection order
+        self.attached = {}
+        # input port row -> the cable driving it
+        self.input_cables = {}
+        # creation order, the newest object is drawn on top
+        self.order = {}
+        self.counter = 0
+
+    def add_object(self, obj):
+        self.counter += 1
+        self.order[obj] = self.counter
+        self.objects.insert(obj, obj.rect)
+        for row in port_rows(obj):
+            self.port_owner[row] = obj
+        self.move_ports(obj)
+
+    def move_object(self, obj):
+        if obj not in self.order:
+            return
+        self.objects.move(obj, obj.rect)
+        self.move_ports(obj)
+
+    def move_ports(self, obj):
+        x, y = obj.rect.x, obj.rect.y
+        for row in port_rows(obj):
+            self.ports.move(row, (x + PORTS.x[row], y + PORTS.y[row], 1, 1))
+
+    def remove_object(self, obj):
+        if obj not in self.order:
+            return
+        del self.order[obj]
+        self.objects.remove(obj)
+        for row in port_rows(obj):
+            self.ports.remove(row)
+            del self.port_owner[row]
+
+    def add_cable(self, cable):
+        self.cable_segments.add(cable)
+        for obj in (cable.output_obj, cable.input_obj):
+            self.attached.setdefault(obj, {})[cable] = None
+        self.input_cables[cable.input_obj.port_base + cable.input_index] = cable
+
+    def update_cable(self, cable):
+        self.cable_segments.update(cable)
+
+    def remove_cable(self, cable):
+        self.cable_segments.remove(cable)
+        for obj in (cable.output_obj, cable.input_obj):
+            cables = self.attached.get(obj)
+            if cables is not None:
+                cables.pop(cable, None)
+                if not cables:
+                    del self.attached[obj]
+        row = cable.input_obj.port_base + cable.input_index
+        if self.input_cables.get(row) is cable:
+            del self.input_cables[row]
+
+    def attached_cables(self, obj):
+        return self.attached.get(obj, {}).keys()
+
+    def input_cable(self, obj, input_index):
+        return self.input_cables.get(obj.port_base + input_index)
+
+    def objects_at(self, pos):
+        # hits under the point, topmost first
+        hits = [obj for obj in self.objects.query_point(pos) if obj.rect.collidepoint(pos)]
+        hits.sort(key=self.order.get, reverse=True)
+        return hits
+
+    def objects_in(self, rect):
+        return [obj for obj in self.objects.query(rect) if rect.colliderect(obj.rect)]
+
+    def closest_port(self, pos, kind, radius):
+        # nearest 'input' or 'output' port as ((obj, kind, index), position)
+        closest = None
+        min_distance = float('inf')
+        for row in self.ports.query_point(pos, radius):
+            obj = self.port_owner[row]
+            index = row - obj.port_base
+            if kind == 'output':
+                index -= obj.input_count
+            if not 0 <= index < (obj.output_count if kind == 'output' else obj.input_count):
+                continue
+            port_pos = (obj.rect.x + PORTS.x[row], obj.rect.y + PORTS.y[row])
+            distance = math.dist(pos, port_pos)
+            if distance < min_distance:
+                min_distance = distance
+                closest = ((obj, kind, index), port_pos)
+        if closest is None or min_distance > radius:
+            return None, None
+        return closest
+
+    def cable_at(self, pos, threshold=5):
+        # nearest cable within the threshold, one vectorized pass over all segments
+        return self.cable_segments.nearest(pos, threshold)
+
+    def cables_in(self, rect):
+        return self.cable_segments.in_rect(rect)
+
+
+def port_rows(obj):
+    return range(obj.port_base, obj.port_base + obj.input_count + obj.output_count)
+
@@ -0,0 +1,47 @@
+import numpy as np
+import pygame
+from .settings import *
+
+
+class WaveformPanel:
+    # the last ticks of every probe as a step trace along the bottom of the
+    # screen, drawn straight from the analyzer's ring
+    def __init__(self, analyzer, width=WIDTH, bottom=HEIGHT - 50):
+        self.analyzer = analyzer
+        self.font = pygame.font.Font(None, 18)
+        self.background_color = WHITE
+        self.text_color = BLACK
+        self.width = width
+        self.bottom = bottom
+        self.label_width = 110
+        self.labels = {}
+
+    @property
+    def rect(self):
+        height = WAVEFORM_ROW_HEIGHT * len(self.analyzer) + 10
+        return pygame.Rect(0, self.bottom - height, self.width, height)
+
+    def label(self, text):
+        if text not in self.labels:
+            self.labels[text] = self.font.render(text, True, self.text_color)
+        return self.labels[text]
+
+    def draw(self, surface):
+        rect = self.rect
+        pygame.draw.rect(surface, self.background_color, rect)
+        right = rect.right - 10
+        window = self.analyzer.window((right - self.label_width) // WAVEFORM_TICK_WIDTH)
+        left = right - len(window) * WAVEFORM_TICK_WIDTH
+        for k, text in enumerate(self.analyzer.labels):
+            top = rect.y + 5 + k * WAVEFORM_ROW_HEIGHT
+            surface.blit(self.label(text), (rect.x + 10, top + 2))
+            if len(window) < 2:
+                continue
+            levels = (top + WAVEFORM_ROW_HEIGHT - 3, top + 3)
+            column = window[:, k]
+            points = [(left, levels[column[0]])]
+            for edge in (np.flatnonzero(column[1:] != column[:-1]) + 1).tolist():
+                x = left + edge * WAVEFORM_TICK_WIDTH
+                points += [(x, levels[column[edge - 1]]), (x, levels[column[edge]])]
+            points.append((right, levels[column[-1]]))
+            pygame.draw.lines(surface, WAVEFORM_COLOR, False, points)
@@ -1,8 +1,53 @@
-from game.application import Game
+import argparse
 
 
 def main():
-    app = Game()
+    parser = argparse.ArgumentParser(description='Digital Logic Simulator')
+    parser.add_argument('circuit', nargs='?',
+                        help='circuit file to open, saved to with ctrl+s')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write per frame timings to a .csv or json lines file')
+    parser.add_argument('--benchmark', metavar='REPORT',
+                        help='run the benchmark suite and write a json report')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='size of the benchmark circuits, relative to the defaults')
+    parser.add_argument('--headless', metavar='CIRCUIT',
+                        help='simulate a circuit file without opening a window')
+    parser.add_argument('--set', action='append', default=[], metavar='[TICK:]ID=VALUE',
+                        help='set a switch, before the given tick (default 0)')
+    parser.add_argument('--ticks', type=int, default=1,
+                        help='number of simulation ticks to run')
+    parser.add_argument('--mode', choices=('levelized', 'compiled', 'event'),
+                        help='simulation mode, defaults to SIMULATION_MODE')
+    parser.add_argument('--json', action='store_true',
+                        help='print the sink states as json')
+    parser.add_argument('--trace', action='store_true',
+                        help='print the sink states after every tick')
+    parser.add_argument('--truth-table', action='store_true',
+                        help='print the truth table over all switches instead')
+    parser.add_argument('--vcd', metavar='FILE',
+                        help='write the switches and sink inputs of every tick to a vcd file')
+    parser.add_argument('--optimize', action='store_true',
+                        help='fold constants, copies and duplicate gates out of the levelized netlist')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        from game.benchmark import run_benchmarks
+        run_benchmarks(args.benchmark, args.scale)
+        return
+
+    if args.headless:
+        from game.headless import run_headless
+        from game.settings import SIMULATION_MODE
+        try:
+            run_headless(args.headless, args.set, args.ticks, args.mode or SIMULATION_MODE,
+                         args.json, args.trace, args.truth_table, args.vcd, args.optimize)
+        except (OSError, ValueError) as error:
+            parser.exit(1, f'{parser.prog}: error: {error}\n')
+        return
+
+    from game.application import Game
+    app = Game(args.circuit, args.profile)
     app.run()
 
 
@@ -0,0 +1,37 @@
+from game.netlist import OP_SWITCH, OP_NOR
+from game.levelized import LevelizedNetlist
+from game.compiled import CompiledNetlist, compile_tick
+
+
+# two NOR latches, the Q output of the first resets the second. components
+# are the set and reset switches of latch 1, its two gates, the two gates of
+# latch 2 and its set switch
+CASCADED_LATCHES = (
+    [OP_SWITCH, OP_SWITCH, OP_NOR, OP_NOR, OP_NOR, OP_NOR, OP_SWITCH],
+    [(1, 0, 2, 0), (3, 0, 2, 1), (0, 0, 3, 0), (2, 0, 3, 1),
+     (2, 0, 4, 0), (5, 0, 4, 1), (6, 0, 5, 0), (4, 0, 5, 1)],
+)
+
+FLIPS = [(1, 1), (1, 0), (6, 1), (6, 0), (0, 1), (0, 0), (1, 1), (1, 0)]
+
+
+def run(netlist):
+    netlist.compile(*CASCADED_LATCHES)
+    netlist.step()
+    trace = []
+    for component, value in FLIPS:
+        netlist.set_component_output(component, value)
+        netlist.step()
+        trace.append(bytes(netlist.values))
+    return trace
+
+
+def test_cascaded_latches_match_levelized():
+    assert run(CompiledNetlist(optimize=False)) == run(LevelizedNetlist(optimize=False))
+
+
+def test_known_topology_is_not_generated_again():
+    CompiledNetlist(optimize=False).compile(*CASCADED_LATCHES)
+    misses = compile_tick.cache_info().misses
+    CompiledNetlist(optimize=False).compile(*CASCADED_LATCHES)
+    assert compile_tick.cache_info().misses == misses